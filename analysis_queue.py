@@ -0,0 +1,258 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update, or_, and_
+from models import db, User, JournalEntry, AnalysisJob
+from utils import get_ai_analysis, FALLBACK_ANALYSIS_RESPONSE
+from rendering import render_entry
+from memory_context import build_memory_context
+from search_index import sync_vector_index
+
+def apply_analysis(entry, user, analysis):
+    """
+    Stores a model analysis on an entry and merges any newly learned memories into the user's.
+    """
+    entry.ai_response = analysis.get('response')
+    entry.analysis_status = 'done'
+    render_entry(entry)
+    new_memories = analysis.get('new_memory_sentences', [])
+    if new_memories:
+        user.add_ai_memories(new_memories, source_entry_id=entry.id)
+
+def memory_context_for(config, user, entry_content):
+    """
+    The user's memories trimmed to the configured prompt budget for analysing `entry_content`.
+    """
+    return build_memory_context(user, entry_content, config.get('MEMORY_CONTEXT_TOKENS', 1200),
+                                config.get('MEMORY_FORGOTTEN_TOKENS', 200))
+
+class AnalysisQueue:
+    """
+    Runs entry analyses in the background so saving an entry never waits on the model.
+
+    Jobs live in the AnalysisJob table, so anything queued survives a restart. A dispatcher
+    thread claims due jobs with a conditional UPDATE (safe with several app processes) and hands
+    them to a bounded thread pool. Failed attempts are retried with exponential backoff; a claim
+    holds a lease, so a job whose worker died is picked up again once the lease expires.
+    After each job the user's vector index is brought up to date by a separate single thread
+    (schedule_vector_sync), so saving an entry never waits on the embedder and a long first
+    backfill never holds up analyses.
+    """
+    def __init__(self, app=None, vector_index=None):
+        self.app = None
+        self.vector_index = vector_index
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._slots = None
+        self._executor = None
+        self._vector_executor = None
+        self._syncing = set()
+        self._sync_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('ANALYSIS_WORKERS', 2)
+        self.max_attempts = app.config.get('ANALYSIS_MAX_ATTEMPTS', 4)
+        self.retry_base = app.config.get('ANALYSIS_RETRY_BASE_SECONDS', 5)
+        self.lease_seconds = app.config.get('ANALYSIS_LEASE_SECONDS', 180)
+        self.poll_interval = app.config.get('ANALYSIS_POLL_SECONDS', 5)
+        # Started explicitly by the web processes (app.start_background_workers) rather than at
+        # import, so scripts that import the app (e.g. send_reminders.py) don't spin up workers.
+
+    def start(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            self._slots = threading.Semaphore(self.workers)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analysis')
+            self._vector_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vector-sync')
+            threading.Thread(target=self._dispatch_loop, name='analysis-dispatcher', daemon=True).start()
+            self._started = True
+
+    def enqueue(self, entry, delay=0):
+        """
+        Queues (or re-queues) analysis for an entry in the caller's session; call wake() after committing.
+        """
+        if entry.id is None:
+            db.session.flush()
+        job = entry.analysis_job
+        if job is None:
+            job = AnalysisJob(entry_id=entry.id, user_id=entry.user_id, revision=1)
+            db.session.add(job)
+        else:
+            job.revision += 1
+        job.status, job.attempts, job.last_error, job.lease_expires_at = 'pending', 0, None, None
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        entry.analysis_status = 'pending'
+        return job
+
+    def enqueue_many(self, user_id, entry_ids, delay=0):
+        """
+        Bulk version of enqueue() for entries written without the ORM (e.g. by an import).
+        Runs in the caller's session; call wake() after committing.
+        """
+        if not entry_ids:
+            return
+        now = datetime.utcnow()
+        values = dict(status='pending', attempts=0, last_error=None, lease_expires_at=None,
+                      next_attempt_at=now + timedelta(seconds=delay), updated_at=now)
+        existing = {row[0] for row in db.session.query(AnalysisJob.entry_id).filter(AnalysisJob.entry_id.in_(entry_ids))}
+        if existing:
+            db.session.execute(update(AnalysisJob).where(AnalysisJob.entry_id.in_(existing))
+                               .values(revision=AnalysisJob.revision + 1, **values))
+        new_ids = [entry_id for entry_id in entry_ids if entry_id not in existing]
+        if new_ids:
+            db.session.execute(insert(AnalysisJob), [dict(values, entry_id=entry_id, user_id=user_id, revision=1, created_at=now)
+                                                     for entry_id in new_ids])
+        db.session.execute(update(JournalEntry).where(JournalEntry.id.in_(entry_ids)).values(analysis_status='pending'))
+
+    def wake(self):
+        self._wake.set()
+
+    def _due_filter(self, now, ignore_schedule=False):
+        due = AnalysisJob.next_attempt_at <= now
+        if ignore_schedule:
+            # Only a first attempt may jump the queue; retries keep their backoff
+            due = or_(due, AnalysisJob.attempts == 0)
+        pending = and_(AnalysisJob.status == 'pending', due)
+        return or_(pending, and_(AnalysisJob.status == 'running', AnalysisJob.lease_expires_at < now))
+
+    def claim(self, job_id, revision, ignore_schedule=False):
+        """
+        Atomically marks a due job as running. Returns True if this caller won the claim.
+        With ignore_schedule=True a job that hasn't been attempted yet can be claimed before its
+        next_attempt_at (used by the streaming view, which runs the analysis itself); jobs
+        waiting out a retry backoff can't.
+        """
+        now = datetime.utcnow()
+        result = db.session.execute(update(AnalysisJob).where(
+            AnalysisJob.id == job_id, AnalysisJob.revision == revision, self._due_filter(now, ignore_schedule)
+        ).values(status='running', attempts=AnalysisJob.attempts + 1, updated_at=now,
+                 lease_expires_at=now + timedelta(seconds=self.lease_seconds)))
+        db.session.commit()
+        return result.rowcount == 1
+
+    def release(self, job_id, revision):
+        """
+        Hands a claimed job back to the background workers, e.g. when a streaming client disconnects.
+        """
+        db.session.rollback()
+        db.session.execute(update(AnalysisJob).where(
+            AnalysisJob.id == job_id, AnalysisJob.revision == revision, AnalysisJob.status == 'running'
+        ).values(status='pending', lease_expires_at=None, next_attempt_at=datetime.utcnow(),
+                 attempts=AnalysisJob.attempts - 1))
+        db.session.commit()
+        self.wake()
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                self._dispatch_due()
+            except Exception as e:
+                print(f"Analysis dispatcher error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _dispatch_due(self):
+        with self.app.app_context():
+            due = db.session.query(AnalysisJob.id, AnalysisJob.revision).filter(self._due_filter(datetime.utcnow())) \
+                .order_by(AnalysisJob.next_attempt_at).limit(self.workers * 4).all()
+            for job_id, revision in due:
+                if not self._slots.acquire(blocking=False):
+                    break
+                if self.claim(job_id, revision):
+                    self._executor.submit(self._run, job_id, revision)
+                else:
+                    self._slots.release()
+
+    def _run(self, job_id, revision):
+        try:
+            with self.app.app_context():
+                self.process(job_id, revision)
+                self.schedule_vector_sync(db.session.query(AnalysisJob.user_id).filter_by(id=job_id).scalar())
+        except Exception as e:
+            print(f"Error running analysis job {job_id}: {e}")
+        finally:
+            self._slots.release()
+            self.wake()
+
+    def schedule_vector_sync(self, user_id):
+        """
+        Embeds the user's new and edited entries in the background, one user at a time.
+        A no-op until the workers are started, or if the user's sync is already queued.
+        """
+        if self.vector_index is None or user_id is None or self._vector_executor is None:
+            return
+        with self._sync_lock:
+            if user_id in self._syncing:
+                return
+            self._syncing.add(user_id)
+        self._vector_executor.submit(self._sync_vectors, user_id)
+
+    def _sync_vectors(self, user_id):
+        try:
+            with self.app.app_context():
+                sync_vector_index(self.vector_index, user_id)
+        except Exception as e:
+            print(f"Error updating vector index: {e}")
+        finally:
+            with self._sync_lock:
+                self._syncing.discard(user_id)
+
+    def process(self, job_id, revision):
+        """
+        Runs one claimed job to completion, retry or failure.
+        """
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None or job.revision != revision:
+            return
+        entry, user = job.entry, db.session.get(User, job.user_id)
+        try:
+            context = memory_context_for(self.app.config, user, entry.content)
+            analysis = get_ai_analysis(self.app.config['GEMINI_API_KEY'], entry.content, context.user_memories,
+                                       context.ai_memories, context.forgotten_memories, strict=True, context_stats=context.stats)
+        except Exception as e:
+            db.session.rollback()
+            self.record_failure(job_id, revision, e)
+            return
+        self.complete(job_id, revision, analysis)
+
+    def complete(self, job_id, revision, analysis):
+        """
+        Applies a finished analysis, unless the entry was saved again in the meantime.
+        """
+        db.session.rollback()  # Start from fresh state; the model call may have taken a while
+        finished = db.session.execute(update(AnalysisJob).where(
+            AnalysisJob.id == job_id, AnalysisJob.revision == revision
+        ).values(status='done', lease_expires_at=None, updated_at=datetime.utcnow()))
+        if finished.rowcount != 1:
+            db.session.rollback()
+            return False
+        job = db.session.get(AnalysisJob, job_id)
+        apply_analysis(job.entry, db.session.get(User, job.user_id), analysis)
+        db.session.commit()
+        return True
+
+    def record_failure(self, job_id, revision, error):
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None or job.revision != revision:
+            return
+        job.last_error = str(error)[:1000]
+        job.lease_expires_at = None
+        if job.attempts >= self.max_attempts:
+            print(f"Analysis job {job_id} failed after {job.attempts} attempts: {error}")
+            job.status = 'failed'
+            job.entry.analysis_status = 'failed'
+            job.entry.ai_response = FALLBACK_ANALYSIS_RESPONSE
+            render_entry(job.entry)
+        else:
+            backoff = self.retry_base * (2 ** (job.attempts - 1))
+            job.status = 'pending'
+            job.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff * random.uniform(1.0, 1.5))
+        db.session.commit()
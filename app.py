@@ -1,20 +1,39 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_file
+from flask import Flask, Response, render_template, redirect, url_for, flash, request, jsonify, stream_with_context, abort
+from flask.helpers import get_debug_flag
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required
 from flask_mail import Mail, Message
 from datetime import datetime, date, timedelta
-from sqlalchemy import extract
-import mistune
+import hashlib
+import os
 import json
-import csv
-import io
 import zipfile
+import click
 
 from config import Config
-from models import db, User, JournalEntry
-from utils import get_ai_greeting, get_ai_analysis, perform_ai_search
+import llm
+from models import db, User, JournalEntry, AnalysisJob, month_day_key
+from migrations import upgrade_schema
+from database import engine_options, configure_sqlite
+from analysis_queue import AnalysisQueue, memory_context_for
+from utils import perform_ai_search, stream_ai_analysis
+from streaming import sse_event
+from export import stream_export, EXPORT_FORMATS
+from importer import import_journal, InvalidImportFile
+from journal_range import RANGE_VIEWS, range_bounds, day_summaries, range_payload
+from rendering import render_entry, ensure_rendered, ensure_entry_rendered, render_markdown
+from search_index import init_search_index, index_entry, remove_user_entries, hybrid_search, sync_vector_index, vector_index_stale
+from vector_index import VectorIndex, get_embedder
+from greeting_cache import GreetingCache
+from search_cache import SearchCache
+from reprocess import REPROCESS_TARGETS, Checkpoint, Reprocessor, find_targets
+from memory_context import compact_memories
+from metrics import Instrumentation, REGISTRY
+from http_cache import conditional, StaticAssets, Compression
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+llm.configure(app.config)
 
 mail = Mail(app)
 
@@ -28,7 +47,18 @@ def load_user(user_id):
     return db.session.get(User, int(user_id))
 
 with app.app_context():
+    configure_sqlite(db.engine, app.config)
     db.create_all()
+    upgrade_schema()
+    init_search_index()
+
+instrumentation = Instrumentation(app, db)
+static_assets = StaticAssets(app)
+compression = Compression(app)
+vector_index = VectorIndex(app.config['VECTOR_INDEX_DIR'] or os.path.join(app.instance_path, 'vectors'), get_embedder(app.config))
+greeting_cache = GreetingCache(app.config)
+search_cache = SearchCache(app.config)
+analysis_queue = AnalysisQueue(app, vector_index=vector_index)
 
 # --- Authentication Routes ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -75,13 +105,12 @@ def logout():
 @app.route('/')
 @login_required
 def dashboard():
-    greeting = get_ai_greeting(app.config['GEMINI_API_KEY'], current_user.user_memories)
+    greeting = greeting_cache.get(app.config['GEMINI_API_KEY'], current_user.id, current_user.user_memories)
     today = date.today()
     on_this_day_entries = JournalEntry.query.filter(
         JournalEntry.user_id == current_user.id,
-        extract('month', JournalEntry.date) == today.month,
-        extract('day', JournalEntry.date) == today.day,
-        extract('year', JournalEntry.date) != today.year
+        JournalEntry.month_day == month_day_key(today),
+        JournalEntry.date != today
     ).order_by(JournalEntry.date.desc()).all()
     return render_template('dashboard.html', greeting=greeting, on_this_day_entries=on_this_day_entries)
 
@@ -94,21 +123,44 @@ def choose_entry_date():
 @login_required
 def journal_view():
     start_date_str = request.args.get('week_start')
-    today = date.today()
-    if start_date_str:
-        week_start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-    else:
-        week_start_date = today - timedelta(days=(today.weekday() + 1) % 7)
-    week_end_date = week_start_date + timedelta(days=6)
-    prev_week_start, next_week_start = week_start_date - timedelta(days=7), week_start_date + timedelta(days=7)
-    entries = JournalEntry.query.filter(JournalEntry.user_id == current_user.id, JournalEntry.date >= week_start_date, JournalEntry.date <= week_end_date).all()
+    anchor = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else date.today()
+    week_start_date, week_end_date, prev_week_start, next_week_start = range_bounds('week', anchor)
+    # Only the date, snippet and AI flag are shown, so the entry texts are never loaded
+    entries = day_summaries(current_user.id, week_start_date, week_end_date)
     entries_by_date = {entry.date: entry for entry in entries}
     week_days = [{"date": week_start_date + timedelta(days=i), "entry": entries_by_date.get(week_start_date + timedelta(days=i))} for i in range(7)]
-    has_any_entry = JournalEntry.query.filter_by(user_id=current_user.id).first()
-    return render_template('journal_view.html', week_days=week_days, week_start_date=week_start_date,
+    has_any_entry = bool(entries) or db.session.query(JournalEntry.id).filter_by(user_id=current_user.id).first() is not None
+    # The summaries are everything the grid shows, so they double as the validator
+    return conditional(('journal', current_user.id, week_start_date, tuple(map(tuple, entries)), has_any_entry, current_user.updated_at),
+                       lambda: render_template('journal_view.html', week_days=week_days, week_start_date=week_start_date,
                            prev_week_url=url_for('journal_view', week_start=prev_week_start.strftime('%Y-%m-%d')),
                            next_week_url=url_for('journal_view', week_start=next_week_start.strftime('%Y-%m-%d')),
-                           has_any_entry=has_any_entry)
+                           has_any_entry=has_any_entry))
+
+@app.route('/calendar')
+@login_required
+def calendar_view():
+    view = request.args.get('view', 'month')
+    if view not in ('month', 'year'):
+        view = 'month'
+    anchor = request.args.get('date') or date.today().strftime('%Y-%m-%d')
+    return render_template('calendar.html', view=view, anchor=anchor)
+
+@app.route('/api/entries/range')
+@login_required
+def entries_range():
+    view = request.args.get('view', 'week')
+    try:
+        anchor = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else date.today()
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    if view not in RANGE_VIEWS:
+        return jsonify({'error': f"view must be one of {', '.join(RANGE_VIEWS)}"}), 400
+    response = jsonify(range_payload(current_user.id, view, anchor))
+    # Clients revalidate visited ranges and get an empty 304 while nothing in them changed
+    response.set_etag(hashlib.sha1(f"{current_user.id}:".encode('utf-8') + response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @app.route('/entry/new')
 @login_required
@@ -122,20 +174,23 @@ def edit_entry(date_str):
     entry = JournalEntry.query.filter_by(date=entry_date, user_id=current_user.id).first()
     if request.method == 'POST':
         content = request.form.get('content')
-        analysis = get_ai_analysis(app.config['GEMINI_API_KEY'], content, current_user.user_memories, current_user.ai_memories, current_user.forgotten_memories)
-        ai_response = analysis.get('response')
-        new_memories = analysis.get('new_memory_sentences', [])
-        if new_memories:
-            updated_ai_memories = current_user.ai_memories
-            for mem in new_memories:
-                if mem not in updated_ai_memories: updated_ai_memories += f"\n- {mem}"
-            current_user.ai_memories = updated_ai_memories.strip()
         if entry:
-            entry.content, entry.ai_response = content, ai_response
+            entry.content, entry.ai_response = content, None
         else:
-            entry = JournalEntry(date=entry_date, content=content, ai_response=ai_response, user_id=current_user.id)
+            entry = JournalEntry(date=entry_date, content=content, user_id=current_user.id)
             db.session.add(entry)
+        # Commit the entry right away; the reflection is produced by a background job.
+        current_user.bump_corpus_version()
+        render_entry(entry)
+        analysis_queue.enqueue(entry, delay=app.config['ANALYSIS_STREAM_GRACE_SECONDS'] if app.config['ANALYSIS_STREAMING'] else 0)
+        index_entry(entry)
         db.session.commit()
+        analysis_queue.wake()
+        # Re-embedded off the request path by the background vector sync
+        try:
+            vector_index.mark_stale(current_user.id, [entry.id])
+        except Exception as e:
+            print(f"Error updating vector index: {e}")
         flash('Entry saved!', 'success')
         return redirect(url_for('view_entry', date_str=date_str))
     return render_template('entry.html', entry_date=entry_date, entry=entry)
@@ -143,26 +198,144 @@ def edit_entry(date_str):
 @app.route('/entry/view/<date_str>')
 @login_required
 def view_entry(date_str):
+    entry_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    # Validate against the timestamps first; the entry texts are only loaded when the client's copy is stale
+    row = db.session.query(JournalEntry.id, JournalEntry.updated_at, JournalEntry.analysis_status) \
+        .filter_by(date=entry_date, user_id=current_user.id).first_or_404()
+
+    def render():
+        entry = db.session.get(JournalEntry, row.id)
+        ensure_entry_rendered(entry)
+        return render_template('view_entry.html', entry=entry)
+
+    stamps = [stamp for stamp in (row.updated_at, current_user.updated_at) if stamp is not None]
+    return conditional(('entry', current_user.id, row.id, row.updated_at, row.analysis_status, current_user.updated_at), render,
+                       last_modified=max(stamps) if stamps else None)
+
+@app.route('/api/entry/<date_str>/status')
+@login_required
+def entry_analysis_status(date_str):
+    entry_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    # Polled every couple of seconds while the analysis runs, so only read the status until it is final
+    row = db.session.query(JournalEntry.id, JournalEntry.analysis_status) \
+        .filter_by(date=entry_date, user_id=current_user.id).first_or_404()
+    data = {'status': row.analysis_status}
+    if row.analysis_status != 'pending':
+        html = db.session.query(JournalEntry.ai_response_html).filter_by(id=row.id).scalar()
+        if html is None:
+            entry = db.session.get(JournalEntry, row.id)
+            ensure_entry_rendered(entry)
+            html = entry.ai_response_html
+        if html:
+            data['ai_response_html'] = html
+    return jsonify(data)
+
+@app.route('/entry/stream/<date_str>')
+@login_required
+def stream_entry_analysis(date_str):
+    """
+    Server-Sent Events stream of the entry's AI reflection. Emits `token` events as text arrives,
+    then `done` with the rendered HTML. Emits `wait` if a background worker already owns the job
+    or it is waiting out a retry backoff (the page then falls back to polling the status endpoint).
+    """
     entry_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     entry = JournalEntry.query.filter_by(date=entry_date, user_id=current_user.id).first_or_404()
-    entry.content_html = mistune.html(entry.content)
-    if entry.ai_response: entry.ai_response_html = mistune.html(entry.ai_response)
-    return render_template('view_entry.html', entry=entry)
+    job = entry.analysis_job
+    user = current_user._get_current_object()
+
+    def generate():
+        if entry.analysis_status != 'pending' or job is None:
+            ensure_rendered(entry)
+            yield sse_event('done', {'status': entry.analysis_status, 'ai_response_html': entry.ai_response_html or ''})
+            return
+        job_id, revision = job.id, job.revision
+        if not analysis_queue.claim(job_id, revision, ignore_schedule=True):
+            yield sse_event('wait', {'status': 'pending'})
+            return
+        finished = False
+        try:
+            context = memory_context_for(app.config, user, entry.content)
+            stream = stream_ai_analysis(app.config['GEMINI_API_KEY'], entry.content, context.user_memories, context.ai_memories,
+                                        context.forgotten_memories, context_stats=context.stats)
+            for text in stream:
+                yield sse_event('token', {'text': text})
+            finished = True
+        except Exception as e:
+            finished = True
+            analysis_queue.record_failure(job_id, revision, e)
+            yield sse_event('wait', {'status': 'pending'})
+            return
+        finally:
+            if not finished:
+                # Client went away mid-stream; let a background worker redo the job.
+                analysis_queue.release(job_id, revision)
+        if analysis_queue.complete(job_id, revision, stream.analysis):
+            ttft = stream.time_to_first_token
+            yield sse_event('done', {'status': 'done', 'ai_response_html': render_markdown(stream.analysis['response']),
+                                     'time_to_first_token_ms': round(ttft * 1000) if ttft is not None else None})
+        else:
+            yield sse_event('wait', {'status': 'pending'})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def run_search(user_id, query, ai_search, semantic=True):
+    """
+    Returns the ids of matching entries in display order, or None if the model call failed.
+    With semantic=False only keyword (FTS) matches are shortlisted.
+    """
+    limit = app.config['SEARCH_CANDIDATE_LIMIT']
+    candidate_ids = hybrid_search(vector_index if semantic else None, user_id, query, limit, app.config['VECTOR_MIN_SCORE'])
+    if not ai_search:
+        # No model configured: the keyword ranking is the result.
+        return candidate_ids
+    entries_by_id = {e.id: e for e in JournalEntry.query.filter(JournalEntry.id.in_(candidate_ids)).all()} if candidate_ids else {}
+    candidates = [entries_by_id[i] for i in candidate_ids if i in entries_by_id]
+    # Top up keyword hits with recent entries so the model can still catch
+    # matches that share no words with the query.
+    if len(candidates) < limit:
+        candidates += JournalEntry.query.filter(JournalEntry.user_id == user_id, JournalEntry.id.notin_(candidate_ids)) \
+            .order_by(JournalEntry.date.desc()).limit(limit - len(candidates)).all()
+    candidates.sort(key=lambda e: e.date)
+    candidates_text = "\n\n---\n\n".join([f"Date: {e.date.strftime('%Y-%m-%d')}\n\n{e.content}" for e in candidates])
+    try:
+        relevant_dates_str = perform_ai_search(app.config['GEMINI_API_KEY'], query, candidates_text, strict=True)
+        relevant_dates = {datetime.strptime(d_str, '%Y-%m-%d').date() for d_str in relevant_dates_str}
+    except Exception as e:
+        print(f"Error processing AI search: {e}")
+        return None
+    return [e.id for e in candidates if e.date in relevant_dates]
 
 @app.route('/search', methods=['GET', 'POST'])
 @login_required
 def search():
-    results, query = [], ""
-    if request.method == 'POST':
-        query = request.form.get('query')
-        if query:
-            all_entries = JournalEntry.query.filter_by(user_id=current_user.id).order_by(JournalEntry.date.asc()).all()
-            all_entries_text = "\n\n---\n\n".join([f"Date: {e.date.strftime('%Y-%m-%d')}\n\n{e.content}" for e in all_entries])
-            relevant_dates_str = perform_ai_search(app.config['GEMINI_API_KEY'], query, all_entries_text)
-            if relevant_dates_str:
-                relevant_dates = [datetime.strptime(d_str, '%Y-%m-%d').date() for d_str in relevant_dates_str]
-                results = [e for e in all_entries if e.date in relevant_dates]
-    return render_template('search.html', query=query, results=results)
+    results, query = [], request.values.get('query', '')
+    ai_search = bool(app.config['GEMINI_API_KEY']) or app.config['LLM_BACKEND'] == 'fake'
+    page, total_pages, result_ids = max(request.args.get('page', 1, type=int), 1), 0, []
+    if query:
+        # Repeats (and the other pages) of a search are served from the cache until an entry changes
+        mode = 'ai' if ai_search else 'keyword'
+        # Until new or edited entries are embedded (in the background), search by keywords only
+        semantic = not vector_index_stale(vector_index, current_user.id)
+        if not semantic:
+            analysis_queue.schedule_vector_sync(current_user.id)
+            mode += '-fts'
+        result_ids = search_cache.get(current_user.id, current_user.corpus_version, query, mode)
+        if result_ids is None:
+            result_ids = run_search(current_user.id, query, ai_search, semantic)
+            if result_ids is None:
+                result_ids = []
+            else:
+                search_cache.set(current_user.id, current_user.corpus_version, query, mode, result_ids)
+        page_size = app.config['SEARCH_PAGE_SIZE']
+        total_pages = max(1, -(-len(result_ids) // page_size))
+        page = min(page, total_pages)
+        page_ids = result_ids[(page - 1) * page_size:page * page_size]
+        entries_by_id = {e.id: e for e in JournalEntry.query.filter(JournalEntry.user_id == current_user.id,
+                                                                     JournalEntry.id.in_(page_ids))} if page_ids else {}
+        results = [entries_by_id[i] for i in page_ids if i in entries_by_id]
+    return render_template('search.html', query=query, results=results, ai_search=ai_search, page=page,
+                           total_pages=total_pages, total_results=len(result_ids))
 
 @app.route('/memories')
 @login_required
@@ -203,15 +376,18 @@ def settings_page():
             flash('Theme updated!', 'success')
         # Clear AI Memories
         elif action == 'clear_ai_memories':
-            current_user.ai_memories = ""
-            current_user.forgotten_memories_json = "[]"
+            current_user.clear_ai_memories()
             db.session.commit()
             flash('AI memories have been cleared.', 'success')
         # Clear All Entries
         elif action == 'clear_entries':
             if request.form.get('confirm_text') == 'destroyer_of_worlds':
+                AnalysisJob.query.filter_by(user_id=current_user.id).delete()
                 JournalEntry.query.filter_by(user_id=current_user.id).delete()
+                remove_user_entries(current_user.id)
+                current_user.bump_corpus_version()
                 db.session.commit()
+                vector_index.remove_user(current_user.id)
                 flash('All journal entries have been deleted.', 'success')
             else:
                 flash('Confirmation text was incorrect.', 'error')
@@ -219,8 +395,10 @@ def settings_page():
         elif action == 'delete_account':
             if request.form.get('confirm_text') == 'destroyer_of_worlds':
                 user_to_delete = User.query.get(current_user.id)
+                remove_user_entries(user_to_delete.id)
                 db.session.delete(user_to_delete)
                 db.session.commit()
+                vector_index.remove_user(user_to_delete.id)
                 flash('Your account has been permanently deleted.', 'success')
                 return redirect(url_for('register'))
             else:
@@ -231,25 +409,47 @@ def settings_page():
 @app.route('/export')
 @login_required
 def export_data():
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr('user_memories.txt', current_user.user_memories)
-        zf.writestr('ai_memories.txt', current_user.ai_memories)
-        entries = JournalEntry.query.filter_by(user_id=current_user.id).order_by(JournalEntry.date.asc()).all()
-        csv_output = io.StringIO()
-        writer = csv.writer(csv_output)
-        writer.writerow(['date', 'content', 'ai_response'])
-        for entry in entries:
-            writer.writerow([entry.date.isoformat(), entry.content, entry.ai_response])
-        zf.writestr('journal.csv', csv_output.getvalue())
-    memory_file.seek(0)
-    return send_file(memory_file, download_name=f'JournAI_Export_{date.today()}.zip', as_attachment=True)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    chunks = stream_export(current_user.id, current_user.user_memories, current_user.ai_memories, fmt=fmt)
+    return Response(stream_with_context(chunks), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename=JournAI_Export_{date.today()}.zip'})
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_data():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose an export .zip, .csv or .jsonl file to import.', 'error')
+        return redirect(url_for('settings_page'))
+    try:
+        stats = import_journal(current_user, upload.stream, upload.filename,
+                               mode='skip' if request.form.get('mode') == 'skip' else 'upsert',
+                               restore_memories=request.form.get('restore_memories') == 'on',
+                               analyze=request.form.get('analyze') == 'on',
+                               analysis_queue=analysis_queue, vector_index=vector_index)
+    except (InvalidImportFile, UnicodeDecodeError, zipfile.BadZipFile) as e:
+        db.session.rollback()
+        flash(f"Import failed: {e}", 'error')
+        return redirect(url_for('settings_page'))
+    print(f"Imported journal for user {current_user.id}: {stats}")
+    message = (f"Imported {stats['rows']} entries ({stats['inserted']} new, {stats['updated']} updated, "
+               f"{stats['unchanged']} unchanged) in {stats['seconds']:.1f}s.")
+    if stats['queued_for_analysis']:
+        message += f" {stats['queued_for_analysis']} will get AI reflections in the background."
+    flash(message, 'success')
+    if stats['invalid']:
+        flash(f"Skipped {stats['invalid']} invalid rows, e.g. {stats['errors'][0]}", 'error')
+    return redirect(url_for('settings_page'))
 
 # --- API Routes for Memories ---
 @app.route('/api/memories', methods=['GET'])
 @login_required
 def get_memories():
-    return jsonify({'user_memories': current_user.user_memories, 'ai_memories': current_user.ai_memories, 'forgotten_memories': current_user.forgotten_memories})
+    return conditional(('memories', current_user.id, current_user.updated_at),
+                       lambda: jsonify({'user_memories': current_user.user_memories, 'ai_memories': current_user.ai_memories, 'forgotten_memories': current_user.forgotten_memories}),
+                       last_modified=current_user.updated_at)
 
 @app.route('/api/memories', methods=['POST'])
 @login_required
@@ -266,11 +466,7 @@ def forget_memory():
     data = request.json
     memory_to_forget = data.get('memory')
     if memory_to_forget:
-        current_user.ai_memories = '\n'.join([line for line in current_user.ai_memories.split('\n') if memory_to_forget not in line])
-        forgotten = current_user.forgotten_memories
-        if memory_to_forget not in forgotten:
-            forgotten.append(memory_to_forget)
-            current_user.forgotten_memories = forgotten
+        current_user.forget_memory(memory_to_forget)
         db.session.commit()
     return jsonify({'status': 'success'})
 
@@ -280,13 +476,170 @@ def reinstate_memory():
     data = request.json
     memory_to_reinstate = data.get('memory')
     if memory_to_reinstate:
-        current_user.ai_memories += f"\n- {memory_to_reinstate}"
-        forgotten = current_user.forgotten_memories
-        if memory_to_reinstate in forgotten:
-            forgotten.remove(memory_to_reinstate)
-            current_user.forgotten_memories = forgotten
+        current_user.reinstate_memory(memory_to_reinstate)
         db.session.commit()
     return jsonify({'status': 'success'})
 
+# --- Metrics ---
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        abort(404)  # Traffic and timings aren't public: only served to scrapers holding the token
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# --- CLI Commands ---
+@app.cli.command('rerender-entries')
+@click.option('--force', is_flag=True, help='Re-render every entry, not just those with missing or stale HTML.')
+@click.option('--batch-size', default=500, show_default=True)
+def rerender_entries(force, batch_size):
+    """Regenerates stored entry HTML, e.g. after changing the markdown configuration."""
+    checked = updated = 0
+    last_id = 0
+    while True:
+        batch = JournalEntry.query.filter(JournalEntry.id > last_id).order_by(JournalEntry.id).limit(batch_size).all()
+        if not batch:
+            break
+        for entry in batch:
+            if force:
+                render_entry(entry)
+                updated += 1
+            elif ensure_rendered(entry):
+                updated += 1
+        checked += len(batch)
+        last_id = batch[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+    click.echo(f"Checked {checked} entries, re-rendered {updated}.")
+
+@app.cli.command('reprocess-entries')
+@click.option('--target', 'targets', multiple=True, type=click.Choice(REPROCESS_TARGETS), default=('missing', 'fallback'),
+              show_default=True, help="Entries to redo: without a response, with the fallback response, or all (repeatable).")
+@click.option('--user', 'username', help='Only this user.')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='First entry date (YYYY-MM-DD).')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Last entry date (YYYY-MM-DD).')
+@click.option('--concurrency', default=2, show_default=True, help='Users processed in parallel.')
+@click.option('--rate-per-minute', type=int, help='Model calls per minute for this job (on top of LLM_RATE_PER_MINUTE).')
+@click.option('--max-consecutive-errors', default=10, show_default=True, help='Stop after this many failures in a row.')
+@click.option('--checkpoint', 'checkpoint_path', type=click.Path(dir_okay=False),
+              help='Progress file (default instance/reprocess-checkpoint.json).')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and start over.')
+@click.option('--dry-run', is_flag=True, help='Only count the matching entries.')
+def reprocess_entries(targets, username, since, until, concurrency, rate_per_minute, max_consecutive_errors,
+                      checkpoint_path, restart, dry_run):
+    """Regenerates AI responses, e.g. after a prompt change or a model outage. Resumable."""
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No user named {username}")
+        user_id = user.id
+    since, until = since.date() if since else None, until.date() if until else None
+    targets_by_user = find_targets(targets, user_id, since, until)
+    total = sum(len(entries) for entries in targets_by_user.values())
+    click.echo(f"{total} entries from {len(targets_by_user)} users match.")
+    if dry_run or not total:
+        return
+    params = {'targets': sorted(targets), 'user_id': user_id, 'since': since and since.isoformat(),
+              'until': until and until.isoformat()}
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(app.instance_path, 'reprocess-checkpoint.json'), params)
+    if restart:
+        checkpoint.remove()
+    try:
+        if checkpoint.load():
+            click.echo(f"Resuming from {checkpoint.path}")
+    except ValueError as e:
+        raise click.ClickException(f"{e}. Use --restart or another --checkpoint.")
+    reprocessor = Reprocessor(app, checkpoint, concurrency=concurrency, rate_per_minute=rate_per_minute,
+                              max_consecutive_errors=max_consecutive_errors, echo=click.echo)
+    stats = reprocessor.run(targets_by_user)
+    for error in reprocessor.errors:
+        click.echo(f"failed: {error}")
+    click.echo(json.dumps(stats))
+    try:
+        click.echo(f"Model calls: {json.dumps(llm.get_client(app.config['GEMINI_API_KEY']).summary().get('analysis', {}))}")
+    except Exception as e:
+        print(f"Error reading model call summary: {e}")
+    if stats['aborted']:
+        raise click.ClickException(f"Stopped after {max_consecutive_errors} failures in a row; run again to resume.")
+    if stats['failed']:
+        click.echo(f"{stats['failed']} entries failed; run again to retry them (progress is in {checkpoint.path}).")
+    else:
+        checkpoint.remove()
+
+@app.cli.command('import-journal')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--mode', type=click.Choice(['upsert', 'skip']), default='upsert', show_default=True,
+              help='What to do with days that already have an entry.')
+@click.option('--analyze', is_flag=True, help='Queue imported entries without an AI response for background analysis.')
+@click.option('--no-memories', is_flag=True, help="Don't restore memory files from an export zip.")
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--validate', is_flag=True, help='Only check the file; write nothing.')
+def import_journal_command(username, path, mode, analyze, no_memories, batch_size, validate):
+    """Imports a JournAI export zip, CSV or JSONL file into USERNAME's journal."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}")
+    try:
+        stats = import_journal(user, path, mode=mode, restore_memories=not no_memories, analyze=analyze,
+                               batch_size=batch_size, analysis_queue=analysis_queue, vector_index=vector_index,
+                               dry_run=validate)
+    except (InvalidImportFile, UnicodeDecodeError, zipfile.BadZipFile) as e:
+        raise click.ClickException(str(e))
+    for error in stats.pop('errors'):
+        click.echo(f"invalid: {error}")
+    click.echo(json.dumps(stats))
+    if analyze and stats['queued_for_analysis']:
+        click.echo("Queued analyses run in the app's background workers.")
+
+@app.cli.command('reindex-vectors')
+@click.option('--user-id', type=int, help='Only this user (defaults to everyone).')
+@click.option('--batch-size', default=500, show_default=True)
+def reindex_vectors_command(user_id, batch_size):
+    """Embeds entries missing from the vector index, e.g. after a deploy or an import. Safe to re-run."""
+    user_ids = [user_id] if user_id else [row.id for row in db.session.query(User.id).order_by(User.id)]
+    for uid in user_ids:
+        if vector_index_stale(vector_index, uid):
+            sync_vector_index(vector_index, uid, batch_size=batch_size)
+            click.echo(f"Indexed user {uid}.")
+    click.echo(f"Vector index up to date for {len(user_ids)} users.")
+
+@app.cli.command('compact-memories')
+@click.option('--user-id', type=int, help='Only compact this user (defaults to everyone).')
+@click.option('--threshold', type=float, help='Similarity needed to merge (defaults to MEMORY_COMPACT_THRESHOLD).')
+@click.option('--dry-run', is_flag=True, help="Report what would be merged without saving.")
+def compact_memories_command(user_id, threshold, dry_run):
+    """Merges near-duplicate AI memories. Meant to run periodically, e.g. as a daily scheduled task."""
+    threshold = threshold if threshold is not None else app.config['MEMORY_COMPACT_THRESHOLD']
+    user_ids = [user_id] if user_id else [row.id for row in db.session.query(User.id).order_by(User.id)]
+    merged = 0
+    for uid in user_ids:
+        merged += compact_memories(uid, threshold, dry_run=dry_run)
+    click.echo(f"{'Would merge' if dry_run else 'Merged'} {merged} memories across {len(user_ids)} users.")
+
+def start_background_workers():
+    """
+    Starts the analysis and vector sync workers. Only processes that serve requests call this:
+    `python app.py` and `flask run` (below) and gunicorn workers (gunicorn.conf.py). Scripts and
+    CLI commands that import the app (send_reminders.py, reprocess-entries, ...) don't.
+    """
+    analysis_queue.start()
+
+def _is_reloader_watcher(use_reloader):
+    # With the reloader on, the first process only watches files; a child process serves requests
+    return use_reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+# `flask run` imports the app from inside its own command
+_cli_context = click.get_current_context(silent=True)
+if _cli_context is not None and _cli_context.info_name == 'run':
+    _reload = _cli_context.params.get('reload')
+    if not _is_reloader_watcher(get_debug_flag() if _reload is None else _reload):
+        start_background_workers()
+
 if __name__ == '__main__':
+    if not _is_reloader_watcher(True):
+        start_background_workers()
     app.run(debug=True)
\ No newline at end of file
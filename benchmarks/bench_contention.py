@@ -0,0 +1,133 @@
+"""
+Read/write contention on the real app routes. Each profile runs in its own process against a
+throwaway SQLite database: reader threads load the journal week and entry pages while writer
+threads save entries and memories, all as separate logged-in users. Reports successful
+requests per second (failed requests return fast, so raw request rates flatter a profile that
+errors a lot), the share of requests that failed, and how many failed with "database is locked".
+Threads share one interpreter, so absolute numbers are lower than with separate worker processes.
+
+    python benchmarks/bench_contention.py [--readers 8] [--writers 4] [--seconds 10]
+    python benchmarks/bench_contention.py --profile wal    # a single profile
+
+Profiles: 'legacy' (rollback journal, no busy timeout: the old defaults) and 'wal' (the
+configured defaults: WAL, synchronous=NORMAL, busy timeout, larger page cache).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES = {
+    'legacy': {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full', 'SQLITE_BUSY_TIMEOUT_MS': '0'},
+    'wal': {},
+}
+
+def run_profile(readers, writers, seconds):
+    sys.path.insert(0, ROOT)
+    from flask import got_request_exception
+    import app as app_module
+
+    app = app_module.app
+    app.logger.disabled = True
+    app_module.start_background_workers()  # As a served app would, so analyses contend for the database too
+    lock = threading.Lock()
+    stats = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0, 'locked': 0}
+
+    def on_exception(sender, exception, **extra):
+        if 'database is locked' in str(exception):
+            with lock:
+                stats['locked'] += 1
+    got_request_exception.connect(on_exception, app)
+
+    def login(name):
+        client = app.test_client()
+        client.post('/register', data={'username': name, 'password': 'pw'})
+        client.post('/login', data={'username': name, 'password': 'pw'})
+        return client
+
+    today = date.today()
+    seed = login('seed')
+    for i in range(30):
+        seed.post(f"/entry/edit/{(today - timedelta(days=i)).isoformat()}", data={'content': f"Seed entry {i}. " * 40})
+
+    deadline = time.monotonic() + seconds
+
+    def reader():
+        client = app.test_client()
+        client.post('/login', data={'username': 'seed', 'password': 'pw'})
+        i = 0
+        while time.monotonic() < deadline:
+            path = '/journal' if i % 2 else f"/entry/view/{(today - timedelta(days=i % 30)).isoformat()}"
+            ok = client.get(path).status_code < 500
+            i += 1
+            with lock:
+                stats['reads'] += 1
+                stats['read_errors'] += 0 if ok else 1
+
+    def writer(n):
+        client = login(f"writer{n}")
+        i = 0
+        while time.monotonic() < deadline:
+            if i % 3 == 2:
+                response = client.post('/api/memories', json={'user_memories': f"My name is Writer {n}.",
+                                                              'ai_memories': f"- Has written {i} times."})
+            else:
+                day = (today - timedelta(days=i % 60)).isoformat()
+                response = client.post(f"/entry/edit/{day}", data={'content': f"Entry {i} from writer {n}. " * 30})
+            i += 1
+            with lock:
+                stats['writes'] += 1
+                stats['write_errors'] += 0 if response.status_code < 500 else 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + \
+              [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    total = stats['reads'] + stats['writes']
+    errors = stats['read_errors'] + stats['write_errors']
+    with app.app_context():
+        journal_mode = app_module.db.session.execute(app_module.db.text('PRAGMA journal_mode')).scalar()
+    print(json.dumps(dict(stats, journal_mode=journal_mode, elapsed_s=round(elapsed, 2),
+                          ok_per_s=round((total - errors) / elapsed, 1),
+                          error_rate=round(errors / total, 4) if total else 0.0)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profile', choices=sorted(PROFILES), action='append')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_profile(args.readers, args.writers, args.seconds)
+        return
+
+    print(f"{'profile':<8} {'ok req/s':>9} {'reads':>7} {'failed':>7} {'writes':>7} {'failed':>7} {'locked':>7} {'error %':>8}")
+    for name in args.profile or ['legacy', 'wal']:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, LLM_BACKEND='fake', ANALYSIS_STREAMING='1', VECTOR_INDEX_DIR=os.path.join(tmp, 'vectors'),
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}", **PROFILES[name])
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--readers', str(args.readers),
+                                     '--writers', str(args.writers), '--seconds', str(args.seconds)],
+                                    env=env, capture_output=True, text=True)
+            lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+            if result.returncode != 0 or not lines:
+                print(f"{name:<8} failed:\n{result.stderr[-2000:]}")
+                continue
+            r = json.loads(lines[-1])
+            print(f"{name:<8} {r['ok_per_s']:>9} {r['reads']:>7} {r['read_errors']:>7} {r['writes']:>7} {r['write_errors']:>7} "
+                  f"{r['locked']:>7} {r['error_rate'] * 100:>7.2f}%  (journal_mode={r['journal_mode']})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Checks that /export streams in bounded memory: seeds a large synthetic journal in a throwaway
+SQLite database, consumes the export stream for each layout and reports throughput and peak
+Python heap use (tracemalloc). Exits non-zero if the peak exceeds --max-peak-mb. The per-entry Markdown layout also has to
+keep zipfile's central-directory record for every file until the end, so it is allowed
+--per-file-kb on top of that.
+
+    python benchmarks/bench_export.py [--entries 20000] [--entry-kb 4] [--max-peak-mb 16]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from models import db, User, JournalEntry, month_day_key
+from export import stream_export, EXPORT_FORMATS
+
+def seed(n_entries, entry_kb):
+    db.session.execute(insert(User.__table__), [{'id': 1, 'username': 'heavy', 'password_hash': 'x', 'theme': 'nebula',
+                                                'user_memories': 'My name is Heavy.', 'ai_memories': '- Writes a lot.',
+                                                'forgotten_memories_json': '[]'}])
+    start = date.today() - timedelta(days=n_entries)
+    rows = []
+    for i in range(n_entries):
+        d = start + timedelta(days=i)
+        # Vary the text so DEFLATE can't collapse it to nothing.
+        content = ' '.join(f"word{(i * 7919 + j) % 100003}" for j in range(entry_kb * 100))
+        rows.append({'user_id': 1, 'date': d, 'month_day': month_day_key(d), 'analysis_status': 'done',
+                     'content': content, 'ai_response': content[:500]})
+        if len(rows) >= 1000:
+            db.session.execute(insert(JournalEntry.__table__), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(JournalEntry.__table__), rows)
+    db.session.commit()
+
+def measure(fmt, keep_output):
+    output = io.BytesIO() if keep_output else None
+    total = 0
+    tracemalloc.start()
+    started = time.perf_counter()
+    for chunk in stream_export(1, 'My name is Heavy.', '- Writes a lot.', fmt=fmt):
+        total += len(chunk)
+        if output is not None:
+            output.write(chunk)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if output is not None:
+        with zipfile.ZipFile(output) as zf:
+            assert zf.testzip() is None, f"{fmt} export produced a corrupt zip"
+    return total, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=20_000)
+    parser.add_argument('--entry-kb', type=int, default=4)
+    parser.add_argument('--max-peak-mb', type=float, default=16)
+    parser.add_argument('--per-file-kb', type=float, default=1.5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            seed(args.entries, args.entry_kb)
+            journal_mb = args.entries * args.entry_kb * 1.1 / 1024
+            print(f"Seeded {args.entries} entries (~{journal_mb:.0f} MB of text)")
+            failed = False
+            for fmt in EXPORT_FORMATS:
+                total, elapsed, peak = measure(fmt, keep_output=False)
+                peak_mb = peak / 1024 / 1024
+                limit_mb = args.max_peak_mb + (args.entries * args.per_file_kb / 1024 if fmt == 'markdown' else 0)
+                ok = peak_mb <= limit_mb
+                failed |= not ok
+                print(f"{fmt:9} {total / 1024 / 1024:8.1f} MB zipped in {elapsed:6.2f}s "
+                      f"({args.entries / elapsed:8.0f} entries/s), peak heap {peak_mb:6.1f} MB (limit {limit_mb:.0f}) {'OK' if ok else 'TOO HIGH'}")
+                # Second pass keeps the output so the archive itself can be checked.
+                measure(fmt, keep_output=True)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Seeds a throwaway SQLite database with journal entries and compares query plans and timings
+of the hot dashboard/journal/reminder queries before and after the indexes on JournalEntry
+(month_day lookup, per-user date range, reminder hour).
+
+    python benchmarks/bench_queries.py [--entries 100000] [--users 50] [--runs 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import extract, text, insert
+from models import db, User, JournalEntry, month_day_key
+
+NEW_INDEXES = ['ix_journal_entry_user_date_snippet', 'ix_journal_entry_user_month_day', 'ix_user_reminder_time']
+
+def seed(n_entries, n_users):
+    db.session.execute(insert(User.__table__), [
+        {'id': i, 'username': f'user{i}', 'password_hash': 'x', 'email': f'user{i}@example.com', 'theme': 'nebula',
+         'reminder_time': i % 24, 'user_memories': '', 'ai_memories': '', 'forgotten_memories_json': '[]'}
+        for i in range(1, n_users + 1)
+    ])
+    per_user = n_entries // n_users
+    start = date.today() - timedelta(days=per_user)
+    rows = []
+    for user_id in range(1, n_users + 1):
+        for day in range(per_user):
+            d = start + timedelta(days=day)
+            rows.append({'user_id': user_id, 'date': d, 'month_day': month_day_key(d), 'analysis_status': 'done',
+                         'content': f'Entry {day} for user {user_id}. ' * 20, 'ai_response': 'A thoughtful reply. ' * 10})
+            if len(rows) >= 5000:
+                db.session.execute(insert(JournalEntry.__table__), rows)
+                rows = []
+    if rows:
+        db.session.execute(insert(JournalEntry.__table__), rows)
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+
+def queries(user_id, indexed):
+    today = date.today()
+    week_start = today - timedelta(days=(today.weekday() + 1) % 7)
+    if indexed:
+        on_this_day = JournalEntry.query.filter(JournalEntry.user_id == user_id, JournalEntry.month_day == month_day_key(today),
+                                                JournalEntry.date != today).order_by(JournalEntry.date.desc())
+        any_entry = db.session.query(JournalEntry.id).filter_by(user_id=user_id).limit(1)
+    else:
+        on_this_day = JournalEntry.query.filter(JournalEntry.user_id == user_id, extract('month', JournalEntry.date) == today.month,
+                                                extract('day', JournalEntry.date) == today.day,
+                                                extract('year', JournalEntry.date) != today.year).order_by(JournalEntry.date.desc())
+        any_entry = JournalEntry.query.filter_by(user_id=user_id).limit(1)
+    return {
+        'dashboard_on_this_day': on_this_day,
+        'journal_week_range': JournalEntry.query.filter(JournalEntry.user_id == user_id, JournalEntry.date >= week_start,
+                                                        JournalEntry.date <= week_start + timedelta(days=6)),
+        'journal_has_any_entry': any_entry,
+        'reminder_users_due': User.query.filter_by(reminder_time=today.day % 24).filter(User.email != None),
+        'reminder_entry_today': JournalEntry.query.filter_by(user_id=user_id, date=today).limit(1),
+    }
+
+def plan(query):
+    compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+def time_query(query, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        query.all()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def run(label, user_id, runs, indexed):
+    results = {}
+    print(f"\n== {label} ==")
+    for name, query in queries(user_id, indexed).items():
+        results[name] = {'median_ms': round(time_query(query, runs), 3), 'plan': plan(query)}
+        print(f"{name:26} {results[name]['median_ms']:9.3f} ms   {' | '.join(results[name]['plan'])}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            seed(args.entries, args.users)
+            print(f"Seeded {args.entries} entries for {args.users} users in {time.perf_counter() - started:.1f}s")
+            user_id = args.users // 2
+            indexes = [index for table in db.metadata.sorted_tables for index in table.indexes if index.name in NEW_INDEXES]
+            for index in indexes:
+                index.drop(db.engine)
+            db.engine.dispose()  # Fresh connections, so no cached statement keeps a stale plan
+            before = run('before (extract() filters, unique (date, user_id) only)', user_id, args.runs, indexed=False)
+            for index in indexes:
+                index.create(db.engine)
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+            db.engine.dispose()
+            after = run('after (month_day + composite indexes)', user_id, args.runs, indexed=True)
+            print("\n== speedup ==")
+            for name in after:
+                print(f"{name:26} {before[name]['median_ms'] / max(after[name]['median_ms'], 1e-6):7.1f}x")
+
+if __name__ == '__main__':
+    main()
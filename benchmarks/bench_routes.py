@@ -0,0 +1,127 @@
+"""
+Route micro-benchmarks, fully offline: the app runs against seeded synthetic data with the
+fake model backend (LLM_BACKEND=fake, with --model-latency seconds per call) and every route
+is timed in-process through the Flask test client, once per journal size.
+
+    python benchmarks/bench_routes.py [--sizes 1000,10000] [--runs 20] [--model-latency 0.05]
+        [--database seeded.db] [--output results.json] [--compare baseline.json]
+
+Without --database a throwaway database is seeded first (see seed_data.py). Results are
+latency percentiles per route and size; --output saves them as JSON, --compare prints the
+change against an earlier file and exits non-zero if any p50 got more than --max-regression slower.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import summarize, save_results, compare_results
+from seed_data import PASSWORD, REMINDER_HOUR, TOPICS, NAMES, seed_all, parse_sizes
+
+ROUTES = ('dashboard', 'journal_view', 'view_entry', 'search', 'export_data', 'send_daily_reminders')
+
+def _timed_requests(make_request, runs, warmup=1):
+    samples, errors = [], 0
+    for i in range(warmup + runs):
+        started = time.perf_counter()
+        response = make_request(i)
+        response.get_data()  # Drain streamed bodies (export) inside the timing
+        elapsed = (time.perf_counter() - started) * 1000
+        if i >= warmup:
+            samples.append(elapsed)
+            errors += 1 if response.status_code != 200 else 0
+    return summarize(samples, errors=errors)
+
+def bench_user(app, username, runs, export_runs, routes):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': PASSWORD})
+    yesterday = date.today() - timedelta(days=1)
+    week_start = yesterday - timedelta(days=(yesterday.weekday() + 1) % 7)
+    queries = [f"{TOPICS[i % len(TOPICS)]} with {NAMES[i % len(NAMES)]}" for i in range(runs + 1)]
+    cases = {
+        'dashboard': (lambda i: client.get('/'), runs),
+        'journal_view': (lambda i: client.get(f"/journal?week_start={week_start - timedelta(days=7 * (i % 4))}"), runs),
+        'view_entry': (lambda i: client.get(f"/entry/view/{yesterday - timedelta(days=i % 30)}"), runs),
+        'search': (lambda i: client.post('/search', data={'query': queries[i % len(queries)]}), runs),
+        'export_data': (lambda i: client.get('/export?format=csv'), export_runs),
+    }
+    results = {}
+    for name, (make_request, n) in cases.items():
+        if name in routes:
+            results[name] = _timed_requests(make_request, n)
+    return results
+
+def bench_reminders(runs):
+    from send_reminders import send_daily_reminders
+    samples = []
+    for i in range(runs + 1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            stats = send_daily_reminders(hour=REMINDER_HOUR, dry_run=True)
+            elapsed = (time.perf_counter() - started) * 1000
+        if i:
+            samples.append(elapsed)
+    return dict(summarize(samples), users_due=stats['due'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000', help="Journal sizes to seed and benchmark")
+    parser.add_argument('--database', help="Use an already seeded database (seed_data.py) instead of a fresh one")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--export-runs', type=int, default=3)
+    parser.add_argument('--model-latency', type=float, default=0.05, help="Seconds per fake model call")
+    parser.add_argument('--routes', default=','.join(ROUTES), help="Comma-separated subset of: " + ', '.join(ROUTES))
+    parser.add_argument('--reminder-users', type=int, default=500)
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Compare against an earlier results file")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+    sizes, routes = parse_sizes(args.sizes), set(args.routes.split(','))
+
+    tmp = tempfile.TemporaryDirectory()
+    database = os.path.abspath(args.database) if args.database else os.path.join(tmp.name, 'bench.db')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{database}",
+        'LLM_BACKEND': 'fake',
+        'LLM_FAKE_LATENCY_SECONDS': str(args.model_latency),
+        # Benchmarks shouldn't measure the rate limiter
+        'LLM_RATE_PER_MINUTE': '1000000',
+        'LLM_BURST': '1000000',
+        'VECTOR_INDEX_DIR': os.path.join(tmp.name, 'vectors'),
+    })
+    from app import app
+
+    with app.app_context():
+        if not args.database:
+            seed_all(sizes, reminder_users=args.reminder_users)
+
+    results = {}
+    for size in sizes:
+        for name, summary in bench_user(app, f"bench{size}", args.runs, args.export_runs, routes).items():
+            results[f"{name}[{size}]"] = summary
+    if 'send_daily_reminders' in routes:
+        with app.app_context():
+            results['send_daily_reminders'] = bench_reminders(max(args.runs // 4, 3))
+
+    print(f"\n{'benchmark':32} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, summary in results.items():
+        print(f"{name:32} {summary['count']:>5} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+              f"{summary['p99_ms']:>9.2f} {summary['errors']:>7}")
+
+    params = {'sizes': sizes, 'runs': args.runs, 'export_runs': args.export_runs, 'model_latency': args.model_latency,
+              'database': args.database, 'reminder_users': args.reminder_users}
+    if args.output:
+        save_results(args.output, 'routes', results, params)
+    regressions = compare_results(args.compare, results, max_regression=args.max_regression) if args.compare else []
+    tmp.cleanup()
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
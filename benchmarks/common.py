@@ -0,0 +1,98 @@
+"""
+Helpers shared by the benchmark scripts: latency summaries and JSON result files that can be
+compared between runs.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    rank = (len(sorted_samples) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_samples) - 1)
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (rank - low)
+
+def summarize(samples_ms, elapsed_s=None, errors=0):
+    """
+    Latency summary (milliseconds) for one benchmark; `elapsed_s` adds a request rate.
+    """
+    ordered = sorted(samples_ms)
+    summary = {
+        'count': len(ordered),
+        'errors': errors,
+        'mean_ms': round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'max_ms': round(ordered[-1], 3) if ordered else 0.0,
+    }
+    if elapsed_s:
+        summary['requests_per_s'] = round(len(ordered) / elapsed_s, 1)
+    return summary
+
+def time_calls(fn, runs, warmup=1):
+    """
+    Calls fn() `warmup` times untimed, then `runs` times; returns the latencies in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def save_results(path, suite, results, params):
+    """
+    Writes a results file: what ran (suite, parameters, git revision, machine) plus `results`,
+    a mapping of benchmark name to summarize() output.
+    """
+    document = {
+        'suite': suite,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print(f"Results written to {path}")
+
+def compare_results(baseline_path, results, metric='p50_ms', max_regression=0.2):
+    """
+    Prints each benchmark's change against a saved baseline. Returns the names that got slower
+    by more than `max_regression` (0.2 = 20%).
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"\n{'benchmark':40} {'baseline':>10} {'now':>10} {'change':>8}   ({metric})")
+    for name, summary in results.items():
+        old = baseline.get(name, {}).get(metric)
+        if not old:
+            print(f"{name:40} {'-':>10} {summary[metric]:>10.2f}")
+            continue
+        change = (summary[metric] - old) / old
+        flag = ' REGRESSION' if change > max_regression else ''
+        print(f"{name:40} {old:>10.2f} {summary[metric]:>10.2f} {change * 100:>+7.1f}%{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
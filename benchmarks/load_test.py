@@ -0,0 +1,182 @@
+"""
+Concurrent HTTP load driver. Each worker logs in with its own cookie session and requests a
+weighted mix of routes for --duration seconds; reports requests per second and p50/p95/p99
+latency overall and per route.
+
+Against a running server:
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --username bench1000 [--password bench]
+
+Fully offline (seeds a throwaway database and serves the app on a free port with the fake model):
+    python benchmarks/load_test.py --serve [--sizes 1000] [--model-latency 0.2]
+
+    [--concurrency 16] [--duration 30] [--mix dashboard=3,journal=3,view=3,search=1,edit=1]
+    [--output load.json] [--compare baseline.json]
+"""
+import argparse
+import http.cookiejar
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import ROOT, summarize, save_results, compare_results
+from seed_data import PASSWORD, TOPICS, NAMES
+
+ROUTES = ('dashboard', 'journal', 'view', 'search', 'edit', 'memories')
+DEFAULT_MIX = 'dashboard=3,journal=3,view=3,search=1,edit=1'
+
+def _requests(rng):
+    """
+    Request factories by route name: each returns (path, form data or None).
+    """
+    yesterday = date.today() - timedelta(days=1)
+    return {
+        'dashboard': lambda: ('/', None),
+        'journal': lambda: (f"/journal?week_start={yesterday - timedelta(days=7 * rng.randrange(8))}", None),
+        'view': lambda: (f"/entry/view/{yesterday - timedelta(days=rng.randrange(60))}", None),
+        'search': lambda: ('/search', {'query': f"{rng.choice(TOPICS)} with {rng.choice(NAMES)}"}),
+        # Today's entry, so reads of older entries keep hitting stored HTML
+        'edit': lambda: (f"/entry/edit/{date.today()}", {'content': f"Load test entry {rng.random()}. " * 20}),
+        'memories': lambda: ('/api/memories', None),
+    }
+
+class Worker(threading.Thread):
+    def __init__(self, base_url, username, password, mix, deadline, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.username, self.password = username, password
+        self.rng = random.Random(seed)
+        self.routes, self.weights = zip(*mix)
+        self.deadline = deadline
+        self.samples = {name: [] for name in self.routes}
+        self.errors = {name: 0 for name in self.routes}
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def fetch(self, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        with self.opener.open(self.base_url + path, data=data, timeout=60) as response:
+            response.read()
+            return response.status
+
+    def run(self):
+        self.fetch('/login', {'username': self.username, 'password': self.password})
+        factories = _requests(self.rng)
+        while time.monotonic() < self.deadline:
+            name = self.rng.choices(self.routes, self.weights)[0]
+            path, form = factories[name]()
+            started = time.perf_counter()
+            try:
+                ok = self.fetch(path, form) == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            self.samples[name].append((time.perf_counter() - started) * 1000)
+            self.errors[name] += 0 if ok else 1
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def serve(tmp, sizes, model_latency):
+    """
+    Seeds a database in `tmp` and starts the app on a free port. Returns (process, base url).
+    """
+    database = os.path.join(tmp, 'bench.db')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", LLM_BACKEND='fake',
+               LLM_FAKE_LATENCY_SECONDS=str(model_latency), LLM_RATE_PER_MINUTE='1000000', LLM_BURST='1000000',
+               VECTOR_INDEX_DIR=os.path.join(tmp, 'vectors'))
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'seed_data.py'), '--database', database,
+                    '--sizes', sizes, '--reminder-users', '0'], env=env, check=True)
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port),
+                                '--no-reload', '--with-threads'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).read()
+            return process, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The app did not start")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--username', help="Defaults to bench<first size> with --serve")
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--serve', action='store_true', help="Seed a throwaway database and serve the app locally")
+    parser.add_argument('--sizes', default='1000', help="Journal sizes to seed with --serve")
+    parser.add_argument('--model-latency', type=float, default=0.2, help="Seconds per fake model call with --serve")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Route weights; routes: " + ', '.join(ROUTES))
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Compare against an earlier results file")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    username = args.username or f"bench{args.sizes.split(',')[0]}"
+    tmp, process, base_url = tempfile.TemporaryDirectory(), None, args.url
+    try:
+        if args.serve:
+            process, base_url = serve(tmp.name, args.sizes, args.model_latency)
+        print(f"Driving {base_url} as {username}: {args.concurrency} workers for {args.duration:.0f}s")
+        started = time.monotonic()
+        workers = [Worker(base_url, username, args.password, mix, started + args.duration, seed)
+                   for seed in range(args.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        tmp.cleanup()
+
+    results = {}
+    all_samples, all_errors = [], 0
+    for name, _ in mix:
+        samples = [s for worker in workers for s in worker.samples[name]]
+        errors = sum(worker.errors[name] for worker in workers)
+        results[name] = summarize(samples, elapsed, errors)
+        all_samples += samples
+        all_errors += errors
+    results['all'] = summarize(all_samples, elapsed, all_errors)
+
+    print(f"\n{'route':12} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, summary in results.items():
+        print(f"{name:12} {summary['count']:>9} {summary.get('requests_per_s', 0):>8} {summary['p50_ms']:>9.1f} "
+              f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary['errors']:>7}")
+
+    params = {'url': None if args.serve else args.url, 'serve': args.serve, 'sizes': args.sizes if args.serve else None,
+              'model_latency': args.model_latency if args.serve else None, 'concurrency': args.concurrency,
+              'duration': args.duration, 'mix': args.mix}
+    if args.output:
+        save_results(args.output, 'load', results, params)
+    regressions = compare_results(args.compare, results, metric='p95_ms', max_regression=args.max_regression) if args.compare else []
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
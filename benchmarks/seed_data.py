@@ -0,0 +1,150 @@
+"""
+Synthetic data for benchmarks: one user per journal size (username `bench<size>`, password
+`bench`) with that many daily entries ending yesterday, a large core-memory blob and many AI
+memories, plus a crowd of email-only users due a reminder at REMINDER_HOUR.
+
+    python benchmarks/seed_data.py --database /tmp/journai-bench.db [--sizes 1000,10000,100000]
+        [--memories 2000] [--user-memory-kb 8] [--reminder-users 500] [--no-render]
+
+The database is created (or upgraded) through the app itself, so it can then be served with
+DATABASE_URL=sqlite:////tmp/journai-bench.db flask --app app run.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'bench'
+REMINDER_HOUR = 9
+TOPICS = ['hiking', 'coffee', 'work', 'deadline', 'sister', 'garden', 'piano', 'rain', 'birthday', 'anxiety',
+          'running', 'dinner', 'movie', 'project', 'vacation', 'dentist', 'promotion', 'cat', 'snow', 'book']
+NAMES = ['Anna', 'Ben', 'Chloe', 'David', 'Elena', 'Farid', 'Grace', 'Hugo', 'Iris', 'Jonas']
+
+def _vocabulary(rng, size=3000):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+def entry_text(rng, vocabulary, words=160):
+    """
+    A few paragraphs of filler with topic words and names mixed in, so keyword, vector and
+    "AI" search all have something to match.
+    """
+    paragraphs = []
+    for _ in range(rng.randint(2, 4)):
+        sentence_words = [rng.choice(vocabulary) for _ in range(words // 3)]
+        for _ in range(3):
+            sentence_words.insert(rng.randrange(len(sentence_words)), rng.choice(TOPICS))
+        sentence_words.insert(rng.randrange(len(sentence_words)), rng.choice(NAMES))
+        paragraphs.append(' '.join(sentence_words).capitalize() + '.')
+    return '\n\n'.join(paragraphs)
+
+def seed_user(username, n_entries, n_memories, user_memory_kb, render=True, seed=0):
+    """
+    Creates (or replaces) one benchmark user with `n_entries` entries. Must run in an app context.
+    """
+    from sqlalchemy import insert
+    from models import db, User, JournalEntry, Memory, month_day_key, memory_hash, entry_snippet
+    from rendering import render_markdown, render_hash
+
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    existing = User.query.filter_by(username=username).first()
+    if existing:
+        db.session.delete(existing)
+        db.session.commit()
+    user = User(username=username, email=f"{username}@example.com", reminder_time=REMINDER_HOUR)
+    user.set_password(PASSWORD)
+    blob = ''
+    while len(blob) < user_memory_kb * 1024:
+        blob += f"- {entry_text(rng, vocabulary, 30)}\n"
+    user.user_memories = f"My name is {username}.\n{blob}"
+    db.session.add(user)
+    db.session.commit()
+
+    yesterday = date.today() - timedelta(days=1)
+    rows = []
+    for i in range(n_entries):
+        day = yesterday - timedelta(days=i)
+        content = entry_text(rng, vocabulary)
+        reply = f"That sounds like a meaningful day. {entry_text(rng, vocabulary, 40)}"
+        row = {'user_id': user.id, 'date': day, 'month_day': month_day_key(day), 'analysis_status': 'done',
+               'content': content, 'ai_response': reply, 'snippet': entry_snippet(content), 'has_ai_response': True}
+        if render:
+            row.update(content_html=render_markdown(content), ai_response_html=render_markdown(reply),
+                       render_hash=render_hash(content, reply))
+        rows.append(row)
+        if len(rows) >= 2000:
+            db.session.execute(insert(JournalEntry.__table__), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(JournalEntry.__table__), rows)
+
+    now = datetime.utcnow()
+    memories = []
+    for i in range(n_memories):
+        text = f"The user mentioned {rng.choice(NAMES)} and {rng.choice(TOPICS)} ({rng.choice(vocabulary)} {i})."
+        memories.append({'user_id': user.id, 'text': text, 'text_hash': memory_hash(text), 'created_at': now,
+                         'forgotten_at': now if i % 10 == 9 else None})
+    if memories:
+        db.session.execute(insert(Memory.__table__), memories)
+    db.session.commit()
+    return user.id
+
+def seed_reminder_users(count, prefix='remind'):
+    """
+    Email-only users with a reminder at REMINDER_HOUR and no entries, for the reminder job.
+    """
+    from sqlalchemy import insert, delete
+    from models import db, User
+    db.session.execute(delete(User.__table__).where(User.username.like(f"{prefix}%")))
+    if not count:
+        db.session.commit()
+        return
+    db.session.execute(insert(User.__table__), [
+        {'username': f"{prefix}{i}", 'password_hash': 'x', 'email': f"{prefix}{i}@example.com", 'theme': 'nebula',
+         'reminder_time': REMINDER_HOUR, 'user_memories': '', 'ai_memories': '', 'forgotten_memories_json': '[]'}
+        for i in range(count)
+    ])
+    db.session.commit()
+
+def seed_all(sizes, n_memories=2000, user_memory_kb=8, reminder_users=500, render=True):
+    """
+    Seeds one user per size plus the reminder crowd and refreshes the search index.
+    Returns {size: username}. Must run in an app context.
+    """
+    from search_index import init_search_index
+    users = {}
+    for size in sizes:
+        started = time.perf_counter()
+        users[size] = f"bench{size}"
+        seed_user(users[size], size, n_memories, user_memory_kb, render=render, seed=size)
+        print(f"Seeded {users[size]} with {size} entries in {time.perf_counter() - started:.1f}s")
+    seed_reminder_users(reminder_users)
+    init_search_index()
+    return users
+
+def parse_sizes(text):
+    return [int(size) for size in text.split(',') if size.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help="SQLite file to create or add to")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Comma-separated entries per user")
+    parser.add_argument('--memories', type=int, default=2000, help="AI memories per user (10%% forgotten)")
+    parser.add_argument('--user-memory-kb', type=int, default=8, help="Size of each user's core memory blob")
+    parser.add_argument('--reminder-users', type=int, default=500)
+    parser.add_argument('--no-render', action='store_true', help="Leave entry HTML to be rendered lazily on view")
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(args.database)}"
+    os.environ.setdefault('LLM_BACKEND', 'fake')
+    from app import app
+    with app.app_context():
+        seed_all(parse_sizes(args.sizes), args.memories, args.user_memory_kb, args.reminder_users, not args.no_render)
+
+if __name__ == '__main__':
+    main()
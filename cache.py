@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from metrics import CACHE_LOOKUPS
+
+class MemoryCache:
+    """
+    In-process LRU cache with a per-item TTL. Thread-safe; hits and misses are counted in
+    metrics.CACHE_LOOKUPS under `name`.
+    """
+    def __init__(self, max_entries=1024, ttl=3600, name='memory'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                CACHE_LOOKUPS.inc(cache=self.name, result='miss')
+                return None
+            self._items.move_to_end(key)
+        CACHE_LOOKUPS.inc(cache=self.name, result='hit')
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._items[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+class RedisCache:
+    """
+    Shared cache for multi-worker deployments. Values are stored as JSON under `prefix`;
+    eviction is left to Redis (TTL on every key, plus the server's maxmemory LRU policy).
+    """
+    def __init__(self, url, prefix='journai:', ttl=3600, name='redis'):
+        import redis  # Optional dependency, only needed when CACHE_REDIS_URL is set
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.name = name
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            CACHE_LOOKUPS.inc(cache=self.name, result='miss')
+            return None
+        CACHE_LOOKUPS.inc(cache=self.name, result='hit')
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl or self.ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+def make_cache(config, prefix, max_entries, ttl):
+    """
+    Returns a RedisCache when CACHE_REDIS_URL is configured, otherwise an in-process MemoryCache.
+    """
+    if config.get('CACHE_REDIS_URL'):
+        try:
+            return RedisCache(config['CACHE_REDIS_URL'], prefix=f"journai:{prefix}:", ttl=ttl, name=prefix)
+        except ImportError:
+            print("CACHE_REDIS_URL is set but the redis package is not installed; using an in-process cache.")
+    return MemoryCache(max_entries=max_entries, ttl=ttl, name=prefix)
@@ -0,0 +1,48 @@
+from sqlalchemy import event
+
+def database_url(url):
+    """
+    Normalizes a DATABASE_URL. Hosting providers often hand out `postgres://` URLs, which
+    SQLAlchemy only accepts as `postgresql://`.
+    """
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database: a checked, recycled connection pool,
+    and for SQLite files a driver-level busy timeout so concurrent writers wait rather than
+    failing straight away with "database is locked".
+    """
+    url = config['SQLALCHEMY_DATABASE_URI']
+    options = {'pool_pre_ping': True, 'pool_recycle': config.get('DB_POOL_RECYCLE', 1800)}
+    if url.startswith('sqlite') and (':memory:' in url or url in ('sqlite://', 'sqlite:///')):
+        return options  # Flask-SQLAlchemy uses a single static connection for in-memory SQLite
+    options.update(pool_size=config.get('DB_POOL_SIZE', 5), max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+                   pool_timeout=config.get('DB_POOL_TIMEOUT', 30))
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000}
+    return options
+
+def configure_sqlite(engine, config):
+    """
+    Sets SQLite pragmas on every new connection: WAL journal mode (readers no longer block on
+    a writer, and vice versa), the synchronous level, busy timeout and page cache size.
+    Does nothing for other databases.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if engine.url.database not in (None, '', ':memory:'):
+                cursor.execute(f"PRAGMA journal_mode={config.get('SQLITE_JOURNAL_MODE', 'wal')}")
+            cursor.execute(f"PRAGMA synchronous={config.get('SQLITE_SYNCHRONOUS', 'normal')}")
+            cursor.execute(f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+            # Negative values are KiB rather than pages
+            cursor.execute(f"PRAGMA cache_size={-int(config.get('SQLITE_CACHE_SIZE_KB', 20000))}")
+        finally:
+            cursor.close()
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import zipfile
+from models import db, JournalEntry
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'markdown')
+
+# Ends the entry text in the Markdown layout, followed by the AI reply if there is one. The HTML
+# comment doesn't show when rendered and, unlike the reply heading, can't be mistaken for entry text.
+ENTRY_END_MARKER = "\n\n<!-- journai:end-of-entry -->\n"
+AI_REPLY_HEADING = "---\n\n## AI Companion's Thoughts\n\n"
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink for zipfile. Collects written bytes until drained,
+    so the archive can be sent to the client piece by piece.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def pending(self):
+        return self._size
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks, self._size = [], 0
+        return data
+
+def iter_entries(user_id, batch_size=500):
+    """
+    Yields (date, content, ai_response) rows in date order without loading them all at once.
+    """
+    query = db.session.query(JournalEntry.date, JournalEntry.content, JournalEntry.ai_response) \
+        .filter(JournalEntry.user_id == user_id).order_by(JournalEntry.date.asc()) \
+        .execution_options(yield_per=batch_size)
+    yield from query
+
+def _markdown_entry(row):
+    text = f"# {row.date.strftime('%A, %B %d, %Y')}\n\n{row.content}{ENTRY_END_MARKER}"
+    if row.ai_response:
+        text += f"{AI_REPLY_HEADING}{row.ai_response}\n"
+    return text
+
+def stream_export(user_id, user_memories, ai_memories, fmt='csv', batch_size=500, chunk_size=64 * 1024):
+    """
+    Generates a JournAI export zip as a stream of byte chunks. Memory use is bounded by
+    `batch_size` rows plus roughly `chunk_size` bytes of compressed output, whatever the journal size
+    (the per-entry Markdown layout additionally keeps a small central-directory record per file).
+
+    Layouts: 'csv' (journal.csv, the original format), 'jsonl' (journal.jsonl, one object per line)
+    or 'markdown' (entries/YYYY-MM-DD.md, one file per entry).
+    """
+    sink = _StreamBuffer()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('user_memories.txt', user_memories)
+        zf.writestr('ai_memories.txt', ai_memories)
+        yield sink.drain()
+        if fmt == 'markdown':
+            for row in iter_entries(user_id, batch_size):
+                zf.writestr(f"entries/{row.date.isoformat()}.md", _markdown_entry(row))
+                if sink.pending() >= chunk_size:
+                    yield sink.drain()
+        else:
+            name = 'journal.jsonl' if fmt == 'jsonl' else 'journal.csv'
+            with zf.open(name, 'w', force_zip64=True) as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+                writer = csv.writer(out) if fmt == 'csv' else None
+                if writer:
+                    writer.writerow(['date', 'content', 'ai_response'])
+                for row in iter_entries(user_id, batch_size):
+                    if writer:
+                        writer.writerow([row.date.isoformat(), row.content, row.ai_response])
+                    else:
+                        out.write(json.dumps({'date': row.date.isoformat(), 'content': row.content, 'ai_response': row.ai_response}) + '\n')
+                    if sink.pending() >= chunk_size:
+                        yield sink.drain()
+    yield sink.drain()
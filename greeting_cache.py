@@ -0,0 +1,68 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache import make_cache
+from metrics import CACHE_LOOKUPS, GREETING_REFRESHES
+from utils import get_ai_greeting, DEFAULT_GREETING
+
+class GreetingCache:
+    """
+    Serves dashboard greetings without waiting on the model.
+
+    Greetings are cached per (user id, hash of user_memories), so editing core memories
+    naturally produces a new key. A cached greeting is fresh for `ttl` seconds; after that it
+    is still served (stale-while-revalidate) for up to `max_stale` seconds while a background
+    worker fetches a new one. On a cold miss the default greeting is shown and the real one
+    is fetched in the background for the next visit. Lookups (including stale hits) and
+    refreshes are counted in metrics.REGISTRY.
+    """
+    def __init__(self, config, workers=2):
+        self.ttl = config.get('GREETING_CACHE_TTL', 3600)
+        self.max_stale = config.get('GREETING_CACHE_MAX_STALE', 86400)
+        self.cache = make_cache(config, 'greeting', config.get('GREETING_CACHE_SIZE', 1024), self.max_stale)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='greeting-refresh')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(user_id, user_memories):
+        digest = hashlib.sha1((user_memories or '').encode('utf-8')).hexdigest()[:16]
+        return f"{user_id}:{digest}"
+
+    def get(self, api_key, user_id, user_memories):
+        """
+        Returns a greeting immediately, scheduling a background refresh when it is missing or stale.
+        """
+        key = self.key(user_id, user_memories)
+        cached = self.cache.get(key)
+        if cached is None:
+            self._schedule_refresh(key, api_key, user_memories)
+            return DEFAULT_GREETING
+        if time.time() - cached['created'] > self.ttl:
+            CACHE_LOOKUPS.inc(cache='greeting', result='stale')
+            self._schedule_refresh(key, api_key, user_memories)
+        return cached['greeting']
+
+    def _schedule_refresh(self, key, api_key, user_memories):
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+        self._executor.submit(self._refresh, key, api_key, user_memories)
+
+    def _refresh(self, key, api_key, user_memories):
+        try:
+            greeting = get_ai_greeting(api_key, user_memories)
+            # The fallback greeting means the model call failed; don't pin it in the cache.
+            if greeting and greeting != DEFAULT_GREETING:
+                self.cache.set(key, {'greeting': greeting, 'created': time.time()})
+                GREETING_REFRESHES.inc(outcome='ok')
+            else:
+                GREETING_REFRESHES.inc(outcome='error')
+        except Exception as e:
+            GREETING_REFRESHES.inc(outcome='error')
+            print(f"Error refreshing greeting: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
@@ -0,0 +1,6 @@
+# gunicorn --config gunicorn.conf.py app:app
+
+def post_worker_init(worker):
+    # Each worker process runs its own analysis workers; job claims are safe across processes
+    from app import start_background_workers
+    start_background_workers()
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from flask import current_app, request, session, make_response
+
+# Responses worth compressing; images and zips are already compressed
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                      'application/json', 'image/svg+xml'}
+
+def build_version(app):
+    """
+    (version, time) of the deployed templates and static files, which pages embed, so a deploy
+    changes their validators. The same in every worker: BUILD_ID if configured, otherwise a hash
+    of the files' contents, dated by the newest file.
+    """
+    cached = app.extensions.get('build_version')
+    if cached is None:
+        digest, newest = hashlib.sha1(), 0.0
+        folders = [os.path.join(app.root_path, app.template_folder or 'templates'), app.static_folder]
+        for folder in [folder for folder in folders if folder and os.path.isdir(folder)]:
+            for dirpath, dirnames, filenames in os.walk(folder):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    with open(path, 'rb') as f:
+                        digest.update(os.path.relpath(path, app.root_path).encode('utf-8') + b'\0' + f.read())
+                    newest = max(newest, os.stat(path).st_mtime)
+        built_at = datetime.fromtimestamp(int(newest), timezone.utc)
+        cached = app.extensions['build_version'] = (app.config.get('BUILD_ID') or digest.hexdigest()[:16], built_at)
+    return cached
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc, microsecond=0) if value.tzinfo is None else value
+
+def conditional(validators, render, last_modified=None):
+    """
+    Serves a GET with ETag / Last-Modified validators. `validators` must cover everything the
+    response shows (row timestamps, ids, ...); when the client's copy matches, an empty 304 is
+    returned without calling `render()`. Responses are private and revalidated on every use.
+    Pages with pending flash messages are always rendered, so the messages aren't lost.
+    """
+    version, built_at = build_version(current_app)
+    etag = hashlib.sha1(repr((version,) + tuple(validators)).encode('utf-8')).hexdigest()
+    modified = max(_as_utc(last_modified), built_at) if last_modified is not None else None
+    if not session.get('_flashes'):
+        if request.if_none_match:
+            fresh = request.if_none_match.contains_weak(etag)
+        else:
+            fresh = modified is not None and request.if_modified_since is not None and modified <= request.if_modified_since
+        if fresh:
+            response = make_response('', 304)
+            _set_validators(response, etag, modified)
+            return response
+    response = make_response(render())
+    _set_validators(response, etag, modified)
+    return response
+
+def _set_validators(response, etag, modified):
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+class StaticAssets:
+    """
+    Fingerprints static URLs: url_for('static', filename=...) gets ?v=<content hash>, and such
+    requests are served with a one-year immutable Cache-Control. Editing a file changes its
+    hash (checked against the file's mtime), so clients pick up the new version at once.
+    """
+    max_age = 365 * 24 * 3600
+
+    def __init__(self, app=None):
+        self._hashes = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        app.url_defaults(self._add_fingerprint)
+        app.after_request(self._cache_headers)
+
+    def fingerprint(self, filename):
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._hashes.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = self._hashes[filename] = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        return cached[1]
+
+    def _add_fingerprint(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = self.fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    def _cache_headers(self, response):
+        if request.endpoint == 'static' and response.status_code == 200 and request.args.get('v'):
+            if request.args['v'] == self.fingerprint(request.view_args['filename']):
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = self.max_age
+                response.cache_control.immutable = True
+                response.expires = time.time() + self.max_age
+        return response
+
+class Compression:
+    """
+    Gzips text responses for clients that accept it. Streamed responses (exports, SSE) are left
+    alone, and strong ETags become weak ones since the bytes on the wire differ per encoding.
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_bytes = app.config.get('COMPRESS_MIN_BYTES', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        if app.config.get('COMPRESS_RESPONSES', True):
+            app.after_request(self._compress)
+
+    def _compress(self, response):
+        response.vary.add('Accept-Encoding')
+        # Static files are sent from a file wrapper (direct_passthrough); generators are real streams
+        streamed = response.is_streamed and not response.direct_passthrough
+        if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_TYPES or streamed
+                or 'Content-Encoding' in response.headers or 'gzip' not in request.accept_encodings):
+            return response
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=self.level))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
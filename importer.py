@@ -0,0 +1,247 @@
+import csv
+import io
+import json
+import re
+import sys
+import time
+import zipfile
+from datetime import datetime
+from sqlalchemy import insert, update, bindparam
+from sqlalchemy.exc import IntegrityError
+from models import db, JournalEntry, AnalysisJob, month_day_key, entry_snippet
+from search_index import index_entries
+from export import ENTRY_END_MARKER, AI_REPLY_HEADING
+
+IMPORT_FORMATS = ('zip', 'csv', 'jsonl')
+
+# Only the first few problems are reported back; the rest are just counted
+MAX_REPORTED_ERRORS = 20
+
+_ENTRY_FILE_RE = re.compile(r"^entries/(\d{4}-\d{2}-\d{2})\.md$")
+# Exports written before ENTRY_END_MARKER only had the reply heading
+_LEGACY_AI_HEADING = "\n---\n\n## AI Companion's Thoughts\n\n"
+
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+class InvalidImportFile(ValueError):
+    pass
+
+# --- Parsing ---
+
+def _text_stream(binary):
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+def _csv_rows(text_stream, source):
+    reader = csv.DictReader(text_stream)
+    if not reader.fieldnames or not {'date', 'content'} <= set(reader.fieldnames):
+        raise InvalidImportFile(f"{source} needs 'date' and 'content' columns")
+    for row in reader:
+        yield f"{source} line {reader.line_num}", row.get('date'), row.get('content'), row.get('ai_response'), None
+
+def _jsonl_rows(text_stream, source):
+    for number, line in enumerate(text_stream, 1):
+        if not line.strip():
+            continue
+        where = f"{source} line {number}"
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield where, None, None, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield where, None, None, None, "expected a JSON object"
+            continue
+        yield where, row.get('date'), row.get('content'), row.get('ai_response'), None
+
+def _markdown_entry(text):
+    """
+    Reverses export._markdown_entry: a date heading, the entry, then optionally the AI reply.
+    The entry and reply come back exactly as exported.
+    """
+    body = text.split('\n\n', 1)[1] if text.startswith('# ') and '\n\n' in text else text
+    content, marker, reply = body.partition(ENTRY_END_MARKER)
+    if marker:
+        reply = reply[len(AI_REPLY_HEADING):-1] if reply.startswith(AI_REPLY_HEADING) and reply.endswith('\n') else None
+        return content, reply or None
+    # Older exports: the heading could also be part of the entry, so this is a best guess
+    content, heading, reply = body.rpartition(_LEGACY_AI_HEADING)
+    if not heading:
+        content, reply = body, None
+    content = content[:-1] if content.endswith('\n') else content
+    return content, reply[:-1] if reply and reply.endswith('\n') else reply
+
+def iter_rows(source, filename='', memories=None):
+    """
+    Yields (location, date, content, ai_response, parse error) from a JournAI export zip (any
+    layout), a CSV file (date, content, ai_response columns) or a JSON Lines file, reading one
+    row at a time.
+    `source` is a path or a binary file object (seekable for zips). For zips, the memory files are
+    stored in the `memories` dict ('user_memories' / 'ai_memories') if one is given.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield from iter_rows(f, filename or source, memories)
+        return
+    name = (filename or '').lower()
+    if zipfile.is_zipfile(source):
+        source.seek(0)
+        with zipfile.ZipFile(source) as zf:
+            names = zf.namelist()
+            if memories is not None:
+                for key in ('user_memories', 'ai_memories'):
+                    if f"{key}.txt" in names:
+                        memories[key] = zf.read(f"{key}.txt").decode('utf-8')
+            if 'journal.csv' in names:
+                with zf.open('journal.csv') as raw:
+                    yield from _csv_rows(_text_stream(raw), 'journal.csv')
+            elif 'journal.jsonl' in names:
+                with zf.open('journal.jsonl') as raw:
+                    yield from _jsonl_rows(_text_stream(raw), 'journal.jsonl')
+            else:
+                entry_files = [n for n in names if _ENTRY_FILE_RE.match(n)]
+                if not entry_files:
+                    raise InvalidImportFile("The zip has no journal.csv, journal.jsonl or entries/*.md")
+                for entry_name in entry_files:
+                    content, reply = _markdown_entry(zf.read(entry_name).decode('utf-8'))
+                    yield entry_name, _ENTRY_FILE_RE.match(entry_name).group(1), content, reply, None
+        return
+    source.seek(0)
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        yield from _jsonl_rows(_text_stream(source), filename or 'upload')
+    else:
+        yield from _csv_rows(_text_stream(source), filename or 'upload')
+
+def _validate(date_value, content, ai_response):
+    """
+    Returns (date, content, ai_response) or raises ValueError with a reason.
+    """
+    if not isinstance(date_value, str):
+        raise ValueError("missing date")
+    entry_date = datetime.strptime(date_value.strip(), '%Y-%m-%d').date()
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("missing content")
+    if ai_response is not None and not isinstance(ai_response, str):
+        raise ValueError("ai_response must be text")
+    return entry_date, content, ai_response or None
+
+# --- Writing ---
+
+def _write_batch(user_id, batch, mode, stats):
+    """
+    Upserts one batch of validated rows in a single transaction. Returns (changed ids, ids of
+    changed entries without an AI response, ids whose content changed).
+    """
+    by_date = {}
+    for entry_date, content, ai_response in batch:
+        by_date[entry_date] = (content, ai_response)  # Later rows for the same day win
+    stats['duplicates'] += len(batch) - len(by_date)
+    existing = {row.date: row for row in db.session.query(JournalEntry.id, JournalEntry.date, JournalEntry.content,
+                                                          JournalEntry.ai_response)
+                .filter(JournalEntry.user_id == user_id, JournalEntry.date.in_(list(by_date)))}
+    inserts, updates, changed_dates = [], [], []
+    for entry_date, (content, ai_response) in by_date.items():
+        old = existing.get(entry_date)
+        if old is None:
+            inserts.append({'user_id': user_id, 'date': entry_date, 'month_day': month_day_key(entry_date),
+                            'content': content, 'ai_response': ai_response, 'analysis_status': 'done',
+                            'snippet': entry_snippet(content), 'has_ai_response': bool(ai_response)})
+        elif mode == 'skip' or (old.content == content and (old.ai_response or None) == ai_response):
+            stats['unchanged'] += 1
+            continue
+        else:
+            updates.append({'row_id': old.id, 'new_content': content, 'new_ai_response': ai_response,
+                            'new_snippet': entry_snippet(content), 'new_has_ai': bool(ai_response)})
+        changed_dates.append(entry_date)
+    if inserts:
+        db.session.execute(insert(JournalEntry.__table__), inserts)
+    if updates:
+        table = JournalEntry.__table__
+        # Stored HTML is cleared and re-rendered lazily on view (or by `flask rerender-entries`)
+        db.session.execute(update(table).where(table.c.id == bindparam('row_id')).values(
+            content=bindparam('new_content'), ai_response=bindparam('new_ai_response'),
+            snippet=bindparam('new_snippet'), has_ai_response=bindparam('new_has_ai'),
+            content_html=None, ai_response_html=None, render_hash=None, analysis_status='done'), updates)
+        # Supersede any queued or running analysis of the old text (see AnalysisQueue.complete)
+        db.session.execute(update(AnalysisJob).where(AnalysisJob.entry_id.in_([u['row_id'] for u in updates])).values(
+            revision=AnalysisJob.revision + 1, status='done', lease_expires_at=None))
+    rows = db.session.query(JournalEntry.id, JournalEntry.ai_response) \
+        .filter(JournalEntry.user_id == user_id, JournalEntry.date.in_(changed_dates)).all() if changed_dates else []
+    stats['inserted'] += len(inserts)
+    stats['updated'] += len(updates)
+    return ([row.id for row in rows], [row.id for row in rows if not row.ai_response],
+            [update_row['row_id'] for update_row in updates])
+
+def import_journal(user, source, filename='', mode='upsert', restore_memories=True, analyze=False,
+                   batch_size=500, analysis_queue=None, vector_index=None, dry_run=False):
+    """
+    Imports entries for `user` from an export zip, CSV or JSONL file (see iter_rows), streaming
+    the file and writing `batch_size` rows per transaction. Entries are matched on date
+    (the _date_user_uc constraint): with mode='upsert' existing days are overwritten, with
+    mode='skip' they are left alone. Memory files in a zip replace the core memories and are
+    merged into the AI memories. With analyze=True, imported entries without an AI response
+    are queued for background analysis. With dry_run=True the file is only validated.
+    Returns a stats dict, including rows_per_s.
+    """
+    if mode not in ('upsert', 'skip'):
+        raise ValueError(f"Unknown import mode {mode!r}")
+    started = time.perf_counter()
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0, 'invalid': 0,
+             'queued_for_analysis': 0, 'memories_added': 0, 'errors': [], 'dry_run': dry_run}
+    memories, batch, content_changed = {}, [], []
+
+    def flush():
+        counts = {key: value for key, value in stats.items() if isinstance(value, int)}
+        for attempt in range(2):
+            try:
+                changed, needs_analysis, updated = _write_batch(user.id, batch, mode, stats)
+                if changed:
+                    user.bump_corpus_version()
+                index_entries(changed)
+                if analyze and analysis_queue is not None and needs_analysis:
+                    analysis_queue.enqueue_many(user.id, needs_analysis)
+                    stats['queued_for_analysis'] += len(needs_analysis)
+                db.session.commit()
+                content_changed.extend(updated)
+                return
+            except IntegrityError:
+                # Someone saved one of these days in the meantime; redo the batch against fresh rows
+                db.session.rollback()
+                stats.update(counts)
+                if attempt:
+                    raise
+
+    for where, date_value, content, ai_response, error in iter_rows(source, filename, memories):
+        try:
+            if error:
+                raise ValueError(error)
+            row = _validate(date_value, content, ai_response)
+        except ValueError as e:
+            stats['invalid'] += 1
+            if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                stats['errors'].append(f"{where}: {e}")
+            continue
+        stats['rows'] += 1
+        if dry_run:
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+    if not dry_run:
+        if restore_memories and memories.get('user_memories', '').strip():
+            user.user_memories = memories['user_memories']
+        if restore_memories and memories.get('ai_memories'):
+            stats['memories_added'] = len(user.add_ai_memories(memories['ai_memories'].split('\n')))
+        db.session.commit()
+        if analyze and analysis_queue is not None and stats['queued_for_analysis']:
+            analysis_queue.wake()
+        if vector_index is not None and content_changed:
+            # Re-embedded by the background vector sync (or `flask reindex-vectors`); new rows are past the watermark
+            vector_index.mark_stale(user.id, content_changed)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_s'] = round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+    return stats
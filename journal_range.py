@@ -0,0 +1,50 @@
+import calendar
+from datetime import date, timedelta
+from models import db, JournalEntry
+
+RANGE_VIEWS = ('week', 'month', 'year')
+
+def week_start(day):
+    """
+    Weeks run Sunday to Saturday.
+    """
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+def range_bounds(view, anchor):
+    """
+    Returns (start, end, previous start, next start) of the week, month or year containing `anchor`.
+    """
+    if view == 'week':
+        start = week_start(anchor)
+        return start, start + timedelta(days=6), start - timedelta(days=7), start + timedelta(days=7)
+    if view == 'month':
+        start = anchor.replace(day=1)
+        end = start.replace(day=calendar.monthrange(start.year, start.month)[1])
+        return start, end, (start - timedelta(days=1)).replace(day=1), end + timedelta(days=1)
+    if view == 'year':
+        start = date(anchor.year, 1, 1)
+        return start, date(anchor.year, 12, 31), date(anchor.year - 1, 1, 1), date(anchor.year + 1, 1, 1)
+    raise ValueError(f"Unknown range view {view!r}")
+
+def day_summaries(user_id, start, end, snippets=True):
+    """
+    (date, has_ai_response[, snippet]) rows for a user's entries between start and end inclusive,
+    read from ix_journal_entry_user_date_snippet without loading the entry texts.
+    """
+    columns = [JournalEntry.date, JournalEntry.has_ai_response] + ([JournalEntry.snippet] if snippets else [])
+    return db.session.query(*columns).filter(JournalEntry.user_id == user_id, JournalEntry.date >= start,
+                                             JournalEntry.date <= end).order_by(JournalEntry.date).all()
+
+def range_payload(user_id, view, anchor):
+    """
+    The JSON body of /api/entries/range. Year ranges leave out snippets to stay small.
+    """
+    start, end, prev_start, next_start = range_bounds(view, anchor)
+    days = []
+    for row in day_summaries(user_id, start, end, snippets=view != 'year'):
+        day = {'date': row.date.isoformat(), 'has_ai': row.has_ai_response}
+        if view != 'year':
+            day['snippet'] = row.snippet
+        days.append(day)
+    return {'view': view, 'start': start.isoformat(), 'end': end.isoformat(), 'prev': prev_start.isoformat(),
+            'next': next_start.isoformat(), 'entries': days}
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+
+class LLMError(Exception):
+    pass
+
+class RateLimitedError(LLMError):
+    pass
+
+# --- Backends ---
+
+class GeminiBackend:
+    """
+    Talks to the Gemini API. Configures the SDK once and keeps one GenerativeModel per model name.
+    """
+    name = 'gemini'
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        self.genai = genai
+        genai.configure(api_key=api_key)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model_name):
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = self.genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def generate(self, model_name, prompt, timeout):
+        return self._model(model_name).generate_content(prompt, request_options={'timeout': timeout}).text
+
+    def stream(self, model_name, prompt, timeout):
+        for chunk in self._model(model_name).generate_content(prompt, stream=True, request_options={'timeout': timeout}):
+            yield chunk.text
+
+    def embed(self, model_name, texts, task_type, timeout):
+        result = self.genai.embed_content(model=model_name, content=list(texts), task_type=task_type,
+                                          request_options={'timeout': timeout})
+        return result['embedding']
+
+    def is_transient(self, error):
+        try:
+            from google.api_core import exceptions
+            transient = (exceptions.ResourceExhausted, exceptions.ServiceUnavailable,
+                         exceptions.InternalServerError, exceptions.DeadlineExceeded)
+        except ImportError:
+            transient = ()
+        return isinstance(error, transient + (TimeoutError, ConnectionError))
+
+class FakeBackend:
+    """
+    Offline stand-in for Gemini with configurable latency, for development, benchmarks and testing.
+    Recognises the app's prompts and answers in the shape each caller expects.
+    """
+    name = 'fake'
+
+    def __init__(self, latency=0.0, chunk_size=8, response=None, memories=()):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.response = response or "Thank you for sharing this. It sounds like a day worth remembering."
+        self.memories = list(memories)
+
+    def _answer(self, prompt):
+        from streaming import MEMORY_DELIMITER
+        if '"relevant_dates"' in prompt:
+            dates = list(dict.fromkeys(re.findall(r"Date: (\d{4}-\d{2}-\d{2})", prompt)))
+            query = re.search(r'Search Query: "(.*)"', prompt)
+            words = query.group(1).lower().split() if query else []
+            sections = prompt.split('\n---\n')
+            relevant = [d for d in dates if any(d in s and any(w in s.lower() for w in words) for s in sections)]
+            return json.dumps({'relevant_dates': relevant})
+        if MEMORY_DELIMITER in prompt:
+            return f"{self.response}\n{MEMORY_DELIMITER}\n{json.dumps(self.memories)}"
+        if '"new_memory_sentences"' in prompt:
+            return json.dumps({'response': self.response, 'new_memory_sentences': self.memories})
+        return "Welcome back! It's good to see you again."
+
+    def generate(self, model_name, prompt, timeout):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    def stream(self, model_name, prompt, timeout):
+        text = self._answer(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        for chunk in chunks:
+            time.sleep(self.latency / max(len(chunks), 1))
+            yield chunk
+
+    def embed(self, model_name, texts, task_type, timeout):
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+            rng = random.Random(seed)
+            vectors.append([rng.uniform(-1, 1) for _ in range(64)])
+        return vectors
+
+    def is_transient(self, error):
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+# --- Limits ---
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, bursts of up to `capacity`.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+# --- Client ---
+
+class LLMClient:
+    """
+    Process-wide entry point for model calls. Adds per-call timeouts, a concurrency cap,
+    a token-bucket rate limit, retries with jittered exponential backoff on transient errors,
+    and a metrics record for every call (see `recent_calls`, `summary()` and `add_listener()`).
+    """
+    def __init__(self, backend, model_name=DEFAULT_MODEL, timeout=30, max_concurrency=4, rate_per_minute=60,
+                 burst=10, max_retries=2, retry_base=0.5, log_calls=False):
+        self.backend = backend
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.log_calls = log_calls
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self.recent_calls = deque(maxlen=500)
+        self.totals = {}
+
+    def add_listener(self, callback):
+        """
+        Registers callback(record) to be called after every model call.
+        """
+        self._listeners.append(callback)
+
+    def _acquire(self):
+        if not self._bucket.acquire(self.timeout):
+            raise RateLimitedError("LLM rate limit exceeded")
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise RateLimitedError("Timed out waiting for a free LLM slot")
+
+    def _backoff(self, attempt):
+        time.sleep(self.retry_base * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _record(self, purpose, started, prompt_chars, response_chars, attempts, error=None, first_token=None, context=None):
+        record = {
+            'purpose': purpose,
+            'backend': self.backend.name,
+            'model': self.model_name,
+            'latency_ms': round((time.monotonic() - started) * 1000, 1),
+            'prompt_chars': prompt_chars,
+            'prompt_tokens_est': (prompt_chars + 3) // 4,
+            'response_chars': response_chars,
+            'attempts': attempts,
+            'outcome': 'error' if error else 'ok',
+            'error': type(error).__name__ if error else None,
+        }
+        if first_token is not None:
+            record['first_token_ms'] = round((first_token - started) * 1000, 1)
+        if context:
+            # Prompt-size details from the caller, e.g. how much memory context was trimmed
+            record['context'] = context
+        with self._lock:
+            self.recent_calls.append(record)
+            totals = self.totals.setdefault(purpose, {'calls': 0, 'errors': 0, 'latency_ms': 0.0, 'prompt_chars': 0, 'response_chars': 0})
+            totals['calls'] += 1
+            totals['errors'] += 1 if error else 0
+            totals['latency_ms'] += record['latency_ms']
+            totals['prompt_chars'] += prompt_chars
+            totals['response_chars'] += response_chars
+            if context and 'context_tokens' in context:
+                totals['context_tokens'] = totals.get('context_tokens', 0) + context['context_tokens']
+                totals['full_context_tokens'] = totals.get('full_context_tokens', 0) + context['full_context_tokens']
+        if self.log_calls:
+            print(f"llm_call {json.dumps(record)}")
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"LLM metrics listener failed: {e}")
+
+    def _call(self, purpose, prompt_chars, fn, context=None):
+        started, attempts = time.monotonic(), 0
+        while True:
+            attempts += 1
+            try:
+                self._acquire()
+            except RateLimitedError as e:
+                self._record(purpose, started, prompt_chars, 0, attempts, e, context=context)
+                raise
+            try:
+                result = fn()
+            except Exception as e:
+                self._semaphore.release()
+                if attempts <= self.max_retries and self.backend.is_transient(e):
+                    self._backoff(attempts - 1)
+                    continue
+                self._record(purpose, started, prompt_chars, 0, attempts, e, context=context)
+                raise
+            self._semaphore.release()
+            self._record(purpose, started, prompt_chars, len(result) if isinstance(result, str) else 0, attempts, context=context)
+            return result
+
+    def generate(self, prompt, purpose='generate', context=None):
+        """
+        Returns the model's full text response. `context` is an optional dict of prompt-size
+        details added to the call's metrics record.
+        """
+        return self._call(purpose, len(prompt), lambda: self.backend.generate(self.model_name, prompt, self.timeout), context)
+
+    def embed(self, texts, model_name, task_type, purpose='embed'):
+        texts = list(texts)
+        return self._call(purpose, sum(len(t) for t in texts),
+                          lambda: self.backend.embed(model_name, texts, task_type, self.timeout))
+
+    def stream(self, prompt, purpose='stream', context=None):
+        """
+        Yields response text chunks as they arrive. Transient errors are retried only until the
+        first chunk has been produced; the concurrency slot is held until the stream is closed.
+        """
+        started, attempts, first_token, response_chars = time.monotonic(), 0, None, 0
+        while True:
+            attempts += 1
+            self._acquire()
+            try:
+                for text in self.backend.stream(self.model_name, prompt, self.timeout):
+                    if first_token is None:
+                        first_token = time.monotonic()
+                    response_chars += len(text)
+                    yield text
+                break
+            except Exception as e:
+                if first_token is None and attempts <= self.max_retries and self.backend.is_transient(e):
+                    self._semaphore.release()
+                    self._backoff(attempts - 1)
+                    continue
+                self._semaphore.release()
+                self._record(purpose, started, len(prompt), response_chars, attempts, e, first_token, context)
+                raise
+            except GeneratorExit:
+                self._semaphore.release()
+                self._record(purpose, started, len(prompt), response_chars, attempts, None, first_token, context)
+                raise
+        self._semaphore.release()
+        self._record(purpose, started, len(prompt), response_chars, attempts, None, first_token, context)
+
+    def summary(self):
+        with self._lock:
+            return {purpose: dict(totals, avg_latency_ms=round(totals['latency_ms'] / totals['calls'], 1))
+                    for purpose, totals in self.totals.items()}
+
+# --- Process-wide clients ---
+
+_settings = {}
+_clients = {}
+_override = None
+_clients_lock = threading.Lock()
+_global_listeners = []
+
+def configure(config):
+    """
+    Applies LLM_* settings from the Flask config. Clients created afterwards use them.
+    """
+    _settings.update({
+        'backend': config.get('LLM_BACKEND', 'gemini'),
+        'model_name': config.get('LLM_MODEL', DEFAULT_MODEL),
+        'timeout': config.get('LLM_TIMEOUT_SECONDS', 30),
+        'max_concurrency': config.get('LLM_MAX_CONCURRENCY', 4),
+        'rate_per_minute': config.get('LLM_RATE_PER_MINUTE', 60),
+        'burst': config.get('LLM_BURST', 10),
+        'max_retries': config.get('LLM_MAX_RETRIES', 2),
+        'log_calls': config.get('LLM_LOG_CALLS', False),
+        'fake_latency': config.get('LLM_FAKE_LATENCY_SECONDS', 0.0),
+    })
+    with _clients_lock:
+        _clients.clear()
+
+def add_call_listener(callback):
+    """
+    Registers callback(record) on every client, including ones created later (e.g. for metrics).
+    """
+    with _clients_lock:
+        _global_listeners.append(callback)
+        for client in _clients.values():
+            client.add_listener(callback)
+        if _override is not None:
+            _override.add_listener(callback)
+
+def set_client(client):
+    """
+    Installs a client used for every call regardless of API key (e.g. one with a FakeBackend
+    in tests or benchmarks). Pass None to go back to the configured clients.
+    """
+    global _override
+    _override = client
+    for listener in _global_listeners if client is not None else ():
+        if listener not in client._listeners:
+            client.add_listener(listener)
+
+def get_client(api_key=None):
+    """
+    Returns the shared client for an API key, creating it on first use.
+    """
+    if _override is not None:
+        return _override
+    settings = dict(_settings)
+    backend_name = settings.pop('backend', 'gemini')
+    fake_latency = settings.pop('fake_latency', 0.0)
+    key = None if backend_name == 'fake' else api_key
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            backend = FakeBackend(latency=fake_latency) if backend_name == 'fake' else GeminiBackend(api_key)
+            client = _clients[key] = LLMClient(backend, **settings)
+            for listener in _global_listeners:
+                client.add_listener(listener)
+        return client
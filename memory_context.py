@@ -0,0 +1,119 @@
+from models import db, User, Memory, memory_hash
+from vector_index import HashingEmbedder
+from utils import tokenize, normalize_rows
+
+# Rough token estimate for English prose (~4 characters per token); good enough for budgeting
+# without shipping a tokenizer.
+CHARS_PER_TOKEN = 4
+
+_embedder = HashingEmbedder(256)
+
+# Ignored when deciding whether one memory restates another
+_STOPWORDS = {'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'at', 'for', 'with', 'is', 'are', 'was',
+              'were', 'be', 'has', 'have', 'had', 'who', 'that', 'their', 'they', 'he', 'she', 'his', 'her',
+              'i', 'my', 'user', 's'}
+
+def estimate_tokens(text):
+    return (len(text or '') + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _bullets(texts):
+    return '\n'.join(f"- {text}" for text in texts)
+
+def _relevance(entry_content, texts):
+    """
+    Cosine similarity of each text to the entry on local hashed word features (no model call).
+    """
+    vectors = normalize_rows(_embedder.embed([entry_content] + list(texts)))
+    return vectors[1:] @ vectors[0]
+
+def _select(entry_content, texts, budget):
+    """
+    Picks the texts most relevant to the entry (newer ones first on ties) that fit in `budget`
+    tokens, and returns them in their original order so prompts stay stable between calls.
+    """
+    costs = [estimate_tokens(f"- {text}\n") for text in texts]
+    if sum(costs) <= budget:
+        return list(texts)
+    scores = _relevance(entry_content, texts)
+    chosen, used = [], 0
+    for i in sorted(range(len(texts)), key=lambda i: (-scores[i], -i)):
+        if used + costs[i] <= budget:
+            chosen.append(i)
+            used += costs[i]
+    return [texts[i] for i in sorted(chosen)]
+
+class MemoryContext:
+    """
+    The memory sections of an analysis prompt, trimmed to a token budget, plus `stats` describing
+    how much was left out (passed to the LLM client so every call records its prompt size).
+    """
+    def __init__(self, user_memories, ai_memories, forgotten_memories, stats):
+        self.user_memories = user_memories
+        self.ai_memories = ai_memories
+        self.forgotten_memories = forgotten_memories
+        self.stats = stats
+
+def build_memory_context(user, entry_content, budget_tokens=1200, forgotten_tokens=200):
+    """
+    Builds the memory context for analysing `entry_content`:
+      - core user memories are always included in full;
+      - AI memories are ranked by relevance to the entry and packed into what is left of the budget;
+      - forgotten memories, deduped on their normalized hash, get at most `forgotten_tokens`,
+        again most relevant first. (Exact repeats are rejected by add_ai_memories anyway, so
+        the prompt list only needs to steer the model away from close paraphrases.)
+    """
+    active = [m.text for m in user._memory_query(forgotten=False)]
+    forgotten = list({memory_hash(m.text): m.text for m in user._memory_query(forgotten=True)}.values())
+
+    user_tokens = estimate_tokens(user.user_memories)
+    remaining = max(0, budget_tokens - user_tokens)
+    reserve = min(forgotten_tokens, estimate_tokens(_bullets(forgotten)), remaining)
+    ai_selected = _select(entry_content, active, remaining - reserve)
+    ai_text = _bullets(ai_selected)
+    forgotten_selected = _select(entry_content, forgotten, min(forgotten_tokens, remaining - estimate_tokens(ai_text)))
+
+    full_tokens = user_tokens + estimate_tokens(_bullets(active)) + estimate_tokens(_bullets(forgotten))
+    context_tokens = user_tokens + estimate_tokens(ai_text) + estimate_tokens(_bullets(forgotten_selected))
+    stats = {
+        'context_tokens': context_tokens,
+        'full_context_tokens': full_tokens,
+        'ai_memories': len(active),
+        'ai_memories_used': len(ai_selected),
+        'forgotten_memories': len(forgotten),
+        'forgotten_memories_used': len(forgotten_selected),
+    }
+    return MemoryContext(user.user_memories, ai_text, forgotten_selected, stats)
+
+def _content_words(text):
+    return {word for word in tokenize(text) if word not in _STOPWORDS}
+
+def compact_memories(user_id, threshold=0.9, dry_run=False):
+    """
+    Folds redundant active memories of one user into the memories that already say the same
+    thing. A memory is redundant when at least `threshold` of its content words appear in a
+    longer (or equally long, newer) memory, e.g. "Lives in Berlin." next to "Lives in Berlin,
+    Germany, with her partner." Merged memories stop using prompt space but keep blocking the
+    same fact from being learned again. Returns the number of memories merged.
+    """
+    memories = Memory.query.filter(Memory.user_id == user_id, Memory.forgotten_at == None,
+                                   Memory.merged_into_id == None).all()
+    words = {m.id: _content_words(m.text) for m in memories}
+    # Shortest first, so a memory is only ever folded into one that is at least as long
+    memories.sort(key=lambda m: (len(m.text), m.id))
+    merged = 0
+    for i, memory in enumerate(memories):
+        own = words[memory.id]
+        if not own:
+            continue
+        for keeper in reversed(memories[i + 1:]):
+            if keeper.merged_into_id is None and len(own & words[keeper.id]) >= threshold * len(own):
+                memory.merged_into_id = keeper.id
+                merged += 1
+                break
+    if dry_run:
+        db.session.rollback()
+    else:
+        if merged:
+            db.session.get(User, user_id).memories_changed()
+        db.session.commit()
+    return merged
@@ -0,0 +1,233 @@
+import json
+import threading
+import time
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+import llm
+
+# Latency buckets (seconds) and size buckets (characters) for the histograms below
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# --- Metric types ---
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.type = 'counter'
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _label_text(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.type = 'histogram'
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, (buckets, count, total) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    rows.append((f"{self.name}_bucket", _label_text(self.labelnames + ('le',), key + (bound,)), bucket_count))
+                rows.append((f"{self.name}_bucket", _label_text(self.labelnames + ('le',), key + ('+Inf',)), count))
+                rows.append((f"{self.name}_count", _label_text(self.labelnames, key), count))
+                rows.append((f"{self.name}_sum", _label_text(self.labelnames, key), round(total, 6)))
+        return rows
+
+class Registry:
+    """
+    Holds metrics and renders them in the Prometheus text exposition format. Values are
+    per process; with several app workers, scrape each one (or use one worker for /metrics).
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram('journai_request_duration_seconds', 'Wall time per request, until the response is returned.',
+                                     ['method', 'endpoint', 'status'])
+REQUEST_SQL_QUERIES = REGISTRY.histogram('journai_request_sql_queries', 'SQL statements executed per request.',
+                                         ['endpoint'], COUNT_BUCKETS)
+SQL_SECONDS = REGISTRY.histogram('journai_sql_query_duration_seconds', 'SQL statement execution time.', ['operation'])
+TEMPLATE_SECONDS = REGISTRY.histogram('journai_template_render_seconds', 'Jinja template render time.', ['template'])
+LLM_SECONDS = REGISTRY.histogram('journai_llm_call_duration_seconds', 'Model call latency, including retries.',
+                                 ['purpose', 'backend', 'outcome'])
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram('journai_llm_first_token_seconds', 'Time to first streamed token.', ['purpose'])
+LLM_PROMPT_CHARS = REGISTRY.histogram('journai_llm_prompt_chars', 'Prompt size per model call.', ['purpose'], SIZE_BUCKETS)
+LLM_CALLS = REGISTRY.counter('journai_llm_calls_total', 'Model calls by outcome and error type.', ['purpose', 'outcome', 'error'])
+LLM_CONTEXT_TOKENS = REGISTRY.counter('journai_llm_memory_context_tokens_total',
+                                      "Estimated memory-context tokens sent ('used') and before budgeting ('full').",
+                                      ['purpose', 'kind'])
+MAIL_SECONDS = REGISTRY.histogram('journai_mail_send_seconds', 'Time to send one email.', ['outcome'])
+SLOW_REQUESTS = REGISTRY.counter('journai_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.', ['endpoint'])
+CACHE_LOOKUPS = REGISTRY.counter('journai_cache_lookups_total', "Cache lookups by cache and result; greeting hits past their TTL also count as 'stale'.",
+                                 ['cache', 'result'])
+GREETING_REFRESHES = REGISTRY.counter('journai_greeting_refreshes_total', 'Background greeting refreshes by outcome.', ['outcome'])
+
+# Per-request detail kept for the slow-request log
+MAX_LOGGED_QUERIES = 200
+
+def observe_mail(seconds, ok):
+    MAIL_SECONDS.observe(seconds, outcome='sent' if ok else 'failed')
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+def _on_llm_call(record):
+    seconds = record['latency_ms'] / 1000
+    LLM_SECONDS.observe(seconds, purpose=record['purpose'], backend=record['backend'], outcome=record['outcome'])
+    LLM_PROMPT_CHARS.observe(record['prompt_chars'], purpose=record['purpose'])
+    LLM_CALLS.inc(purpose=record['purpose'], outcome=record['outcome'], error=record['error'] or '')
+    if 'first_token_ms' in record:
+        LLM_FIRST_TOKEN_SECONDS.observe(record['first_token_ms'] / 1000, purpose=record['purpose'])
+    context = record.get('context') or {}
+    if 'context_tokens' in context:
+        LLM_CONTEXT_TOKENS.inc(context['context_tokens'], purpose=record['purpose'], kind='used')
+        LLM_CONTEXT_TOKENS.inc(context['full_context_tokens'], purpose=record['purpose'], kind='full')
+    if has_request_context() and 'metrics_llm' in g:
+        g.metrics_llm.append(record)
+
+class Instrumentation:
+    """
+    Collects request, SQL, template and LLM timings into REGISTRY (served by /metrics), and
+    logs a breakdown of any request slower than SLOW_REQUEST_MS (0 disables the log).
+    """
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', 0)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        llm.add_call_listener(_on_llm_call)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_execute)
+            event.listen(db.engine, 'handle_error', self._on_execute_error)
+
+    # --- Requests ---
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_seconds = 0.0
+        g.metrics_queries = []
+        g.metrics_llm = []
+
+    def _finish(self, status):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        endpoint = _endpoint()
+        REQUEST_SECONDS.observe(seconds, method=request.method, endpoint=endpoint, status=status)
+        REQUEST_SQL_QUERIES.observe(g.metrics_sql_count, endpoint=endpoint)
+        if self.slow_request_ms and seconds * 1000 >= self.slow_request_ms:
+            SLOW_REQUESTS.inc(endpoint=endpoint)
+            print("slow_request " + json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': status,
+                'duration_ms': round(seconds * 1000, 1),
+                'sql_count': g.metrics_sql_count,
+                'sql_ms': round(g.metrics_sql_seconds * 1000, 1),
+                'queries': g.metrics_queries,
+                'llm_calls': [{key: call.get(key) for key in ('purpose', 'latency_ms', 'first_token_ms', 'prompt_chars',
+                                                              'outcome', 'error')} for call in g.metrics_llm],
+            }))
+
+    def _after_request(self, response):
+        self._finish(response.status_code)
+        return response
+
+    def _teardown_request(self, error=None):
+        if error is not None:
+            self._finish(500)
+
+    # --- Templates ---
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        if has_request_context() and g.get('metrics_templates'):
+            TEMPLATE_SECONDS.observe(time.perf_counter() - g.metrics_templates.pop(), template=template.name or 'string')
+
+    # --- SQL ---
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _on_execute_error(self, exception_context):
+        # after_cursor_execute doesn't run for failed statements; drop their start time here
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('metrics_started'):
+            conn.info['metrics_started'].pop()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['metrics_started'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        SQL_SECONDS.observe(seconds, operation=operation if operation in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER')
+        if has_request_context() and 'metrics_sql_count' in g:
+            g.metrics_sql_count += 1
+            g.metrics_sql_seconds += seconds
+            if len(g.metrics_queries) < MAX_LOGGED_QUERIES:
+                g.metrics_queries.append({'sql': ' '.join(statement.split())[:300], 'ms': round(seconds * 1000, 2)})
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime
+from sqlalchemy import inspect, text, update, bindparam, or_
+from models import db, User, JournalEntry, month_day_key, entry_snippet
+
+# Indexes made redundant by wider ones; dropped so writes don't keep maintaining them
+DROPPED_INDEXES = ['ix_journal_entry_user_date']
+
+def upgrade_schema():
+    """
+    Brings an existing database up to date with the models. db.create_all() only creates
+    missing tables, so this adds columns and indexes introduced since a table was created,
+    and drops DROPPED_INDEXES. Must be called inside an app context, after db.create_all().
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                ddl += f" NOT NULL DEFAULT {_sql_literal(default)}" if not column.nullable else f" DEFAULT {_sql_literal(default)}"
+            db.session.execute(text(ddl))
+            print(f"Added column {table.name}.{column.name}")
+        db.session.commit()
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+        for index in inspector.get_indexes(table.name):
+            if index['name'] in DROPPED_INDEXES:
+                db.session.execute(text(f'DROP INDEX "{index["name"]}"'))
+                db.session.commit()
+                print(f"Dropped index {index['name']}")
+    backfill_month_day()
+    backfill_snippets()
+    backfill_updated_at()
+    migrate_memory_blobs()
+
+def backfill_month_day(batch_size=1000):
+    """
+    Fills JournalEntry.month_day for rows written before the column existed.
+    """
+    total = 0
+    while True:
+        rows = db.session.query(JournalEntry.id, JournalEntry.date).filter(JournalEntry.month_day.is_(None)).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(
+            update(JournalEntry.__table__).where(JournalEntry.__table__.c.id == bindparam('row_id')).values(month_day=bindparam('key')),
+            [{'row_id': row.id, 'key': month_day_key(row.date)} for row in rows]
+        )
+        db.session.commit()
+        total += len(rows)
+    if total:
+        print(f"Backfilled month_day for {total} entries")
+
+def backfill_updated_at():
+    """
+    Stamps User.updated_at and JournalEntry.updated_at on rows written before the columns
+    existed, so their HTTP validators change when the rows do.
+    """
+    now = datetime.utcnow()
+    for model in (User, JournalEntry):
+        result = db.session.execute(update(model.__table__).where(model.__table__.c.updated_at.is_(None)).values(updated_at=now))
+        db.session.commit()
+        if result.rowcount:
+            print(f"Backfilled updated_at for {result.rowcount} {model.__tablename__} rows")
+
+def backfill_snippets(batch_size=1000):
+    """
+    Fills JournalEntry.snippet and has_ai_response for rows written before the columns existed.
+    """
+    total = 0
+    while True:
+        rows = db.session.query(JournalEntry.id, JournalEntry.content, JournalEntry.ai_response) \
+            .filter(JournalEntry.snippet.is_(None)).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(
+            update(JournalEntry.__table__).where(JournalEntry.__table__.c.id == bindparam('row_id'))
+            .values(snippet=bindparam('new_snippet'), has_ai_response=bindparam('new_has_ai')),
+            [{'row_id': row.id, 'new_snippet': entry_snippet(row.content), 'new_has_ai': bool(row.ai_response)} for row in rows]
+        )
+        db.session.commit()
+        total += len(rows)
+    if total:
+        print(f"Backfilled snippets for {total} entries")
+
+def migrate_memory_blobs():
+    """
+    Moves memories from the legacy User.ai_memories / forgotten_memories_json text blobs into
+    Memory rows (deduplicated on the normalized hash), then empties the blobs.
+    """
+    users = User.query.filter(or_(User.legacy_ai_memories != '', User.legacy_forgotten_memories_json != '[]')).all()
+    for user in users:
+        user.add_ai_memories((user.legacy_ai_memories or '').split('\n'))
+        try:
+            forgotten = json.loads(user.legacy_forgotten_memories_json or '[]')
+        except ValueError:
+            forgotten = []
+        for memory in forgotten:
+            user.forget_memory(memory)
+        user.legacy_ai_memories, user.legacy_forgotten_memories_json = '', '[]'
+        db.session.commit()
+    if users:
+        print(f"Migrated memories for {len(users)} users")
+
+def _sql_literal(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
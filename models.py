@@ -1,11 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-import json
-from sqlalchemy import UniqueConstraint
+import hashlib
+import re
+from datetime import datetime
+from sqlalchemy import UniqueConstraint, Index, event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
 db = SQLAlchemy()
 
+# Length of the stored JournalEntry.snippet
+SNIPPET_LENGTH = 80
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -14,13 +22,20 @@ class User(UserMixin, db.Model):
     # NEW: Added fields for settings
     email = db.Column(db.String(120), unique=True, nullable=True)
     theme = db.Column(db.String(20), nullable=False, default='nebula')
-    reminder_time = db.Column(db.Integer, nullable=True) # Will store the hour (0-23)
+    reminder_time = db.Column(db.Integer, nullable=True, index=True) # Will store the hour (0-23)
 
     user_memories = db.Column(db.Text, nullable=False, default="My name is...")
-    ai_memories = db.Column(db.Text, nullable=False, default="")
-    forgotten_memories_json = db.Column(db.Text, nullable=False, default="[]")
+    # Legacy text blobs; their contents are migrated into Memory rows at startup (see migrations.py)
+    legacy_ai_memories = db.Column('ai_memories', db.Text, nullable=False, default="")
+    legacy_forgotten_memories_json = db.Column('forgotten_memories_json', db.Text, nullable=False, default="[]")
+    # Bumped whenever entry contents change, which invalidates cached search results (see search_cache.py)
+    corpus_version = db.Column(db.Integer, nullable=False, default=0)
+    # Last change to the user row or their memories (see memories_changed); drives HTTP caching
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     entries = db.relationship('JournalEntry', backref='author', lazy=True, cascade="all, delete-orphan")
+    memories = db.relationship('Memory', lazy=True, cascade="all, delete-orphan")
+    reminder_logs = db.relationship('ReminderLog', lazy=True, cascade="all, delete-orphan")
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -28,19 +43,225 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def bump_corpus_version(self):
+        # Incremented in SQL so concurrent writers can't lose a bump
+        self.corpus_version = User.corpus_version + 1
+
+    def memories_changed(self):
+        # Memory rows live in their own table, so their changes are stamped on the user explicitly
+        self.updated_at = datetime.utcnow()
+
+    def _memory_query(self, forgotten):
+        query = Memory.query.filter(Memory.user_id == self.id, Memory.merged_into_id == None)
+        if forgotten:
+            return query.filter(Memory.forgotten_at != None).order_by(Memory.forgotten_at, Memory.id)
+        return query.filter(Memory.forgotten_at == None).order_by(Memory.id)
+
+    def _find_memory(self, text):
+        return Memory.query.filter_by(user_id=self.id, text_hash=memory_hash(text)).first()
+
+    @property
+    def ai_memories(self):
+        """
+        Active AI memories as the "- sentence" text block used in prompts, exports and the memories page.
+        """
+        return '\n'.join(f"- {m.text}" for m in self._memory_query(forgotten=False))
+
+    @ai_memories.setter
+    def ai_memories(self, text):
+        # A full replacement from the memories page: keep what's still listed, drop what isn't.
+        wanted = {}
+        for line in (text or '').split('\n'):
+            if normalize_memory(line):
+                wanted.setdefault(memory_hash(line), normalize_memory(line))
+        memories, deleted = Memory.query.filter_by(user_id=self.id).all(), set()
+        for memory in memories:
+            if memory.text_hash in wanted:
+                memory.text, memory.forgotten_at, memory.merged_into_id = wanted.pop(memory.text_hash), None, None
+            elif memory.forgotten_at is None and memory.merged_into_id is None:
+                db.session.delete(memory)
+                deleted.add(memory.id)
+        for memory in memories:
+            if memory.merged_into_id in deleted:
+                db.session.delete(memory)
+        for text_hash, memory_text in wanted.items():
+            db.session.add(Memory(user_id=self.id, text=memory_text, text_hash=text_hash))
+        self.memories_changed()
+
     @property
     def forgotten_memories(self):
-        return json.loads(self.forgotten_memories_json)
+        return [m.text for m in self._memory_query(forgotten=True)]
 
-    @forgotten_memories.setter
-    def forgotten_memories(self, memories_list):
-        self.forgotten_memories_json = json.dumps(memories_list)
+    def add_ai_memories(self, new_memories, source_entry_id=None):
+        """
+        Adds newly learned memories, skipping any already known (including forgotten ones)
+        with one indexed lookup on the normalized hash. Returns the texts actually added.
+        """
+        candidates = {}
+        for mem in new_memories:
+            if normalize_memory(mem):
+                candidates.setdefault(memory_hash(mem), normalize_memory(mem))
+        if not candidates:
+            return []
+        known = {row[0] for row in db.session.query(Memory.text_hash).filter(Memory.user_id == self.id, Memory.text_hash.in_(candidates))}
+        added = []
+        for text_hash, memory_text in candidates.items():
+            # Another request may learn the same memory between the lookup and the insert
+            if text_hash not in known and _insert_memory_if_new(dict(user_id=self.id, text=memory_text, text_hash=text_hash,
+                                                                     source_entry_id=source_entry_id)):
+                added.append(memory_text)
+        if added:
+            self.memories_changed()
+        return added
+
+    def forget_memory(self, text):
+        memory = self._find_memory(text)
+        if memory is None:
+            # Not learned (yet); record it as forgotten so it is never learned later.
+            memory = Memory(user_id=self.id, text=normalize_memory(text), text_hash=memory_hash(text))
+            db.session.add(memory)
+        if memory.forgotten_at is None:
+            memory.forgotten_at = datetime.utcnow()
+        memory.merged_into_id = None
+        self.memories_changed()
+
+    def reinstate_memory(self, text):
+        memory = self._find_memory(text)
+        if memory is None:
+            db.session.add(Memory(user_id=self.id, text=normalize_memory(text), text_hash=memory_hash(text)))
+        else:
+            memory.forgotten_at, memory.merged_into_id = None, None
+        self.memories_changed()
+
+    def clear_ai_memories(self):
+        # Forgotten memories (and anything merged into them) are kept, so they are never learned again
+        active_ids = [row[0] for row in db.session.query(Memory.id).filter(
+            Memory.user_id == self.id, Memory.forgotten_at == None, Memory.merged_into_id == None)]
+        if active_ids:
+            Memory.query.filter(Memory.merged_into_id.in_(active_ids)).delete(synchronize_session=False)
+            Memory.query.filter(Memory.id.in_(active_ids)).delete(synchronize_session=False)
+        self.memories_changed()
 
 class JournalEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
     content = db.Column(db.Text, nullable=False)
     ai_response = db.Column(db.Text, nullable=True)
+    # Pre-rendered markdown, valid while render_hash matches rendering.render_hash(content, ai_response)
+    content_html = db.Column(db.Text, nullable=True)
+    ai_response_html = db.Column(db.Text, nullable=True)
+    render_hash = db.Column(db.String(40), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # month * 100 + day (e.g. 1231), so "on this day" lookups can use an index; set automatically on write
+    month_day = db.Column(db.Integer, nullable=True)
+    # Start of the content and whether there is an AI reply, for calendar views that shouldn't read
+    # the full texts; set automatically on write (see entry_snippet)
+    snippet = db.Column(db.String(SNIPPET_LENGTH), nullable=True)
+    has_ai_response = db.Column(db.Boolean, nullable=False, default=False)
+    # 'pending' while a background analysis job is queued or running, then 'done' or 'failed'
+    analysis_status = db.Column(db.String(20), nullable=False, default='done')
+    # Set on every write, including bulk ones (a Core-level default); drives HTTP caching
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    analysis_job = db.relationship('AnalysisJob', backref='entry', uselist=False, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        UniqueConstraint('date', 'user_id', name='_date_user_uc'),
+        # Per-user date ranges (journal view, export, "any entries yet?" probes, reminder checks);
+        # calendar ranges (week grid, month/year heatmaps) are answered from the index alone
+        Index('ix_journal_entry_user_date_snippet', 'user_id', 'date', 'has_ai_response', 'snippet'),
+        # "On this day": equality on month_day, ordered by date, without touching the table
+        Index('ix_journal_entry_user_month_day', 'user_id', 'month_day', 'date'),
+    )
+
+class AnalysisJob(db.Model):
+    """
+    Persisted queue of entry analyses, one row per entry. Saving an entry again bumps
+    `revision`, which supersedes any run of an older revision that is still in flight.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id'), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=1)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True) # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Memory(db.Model):
+    """
+    One AI-learned fact about a user. `text_hash` is the hash of the normalized text and is
+    unique per user, so dedupe, forget and reinstate are single indexed lookups.
+    Forgotten memories keep their row (forgotten_at is set) so they are never re-learned, as do
+    memories folded into a near-duplicate by compaction (merged_into_id is set).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    text_hash = db.Column(db.String(40), nullable=False)
+    source_entry_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    forgotten_at = db.Column(db.DateTime, nullable=True)
+    merged_into_id = db.Column(db.Integer, db.ForeignKey('memory.id'), nullable=True)
+
+    __table_args__ = (UniqueConstraint('user_id', 'text_hash', name='_memory_user_hash_uc'),)
+
+class ReminderLog(db.Model):
+    """
+    One row per reminder email sent, so a re-run of the reminder job never double-sends.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    sent_on = db.Column(db.Date, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint('user_id', 'sent_on', name='_reminder_user_day_uc'),)
+
+def _insert_memory_if_new(values):
+    """
+    Inserts a Memory row unless the user already has one with that text_hash. Returns True if inserted.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        result = db.session.execute(insert(Memory).values(**values).on_conflict_do_nothing(index_elements=['user_id', 'text_hash']))
+        return result.rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.add(Memory(**values))
+        return True
+    except IntegrityError:
+        return False
+
+def normalize_memory(text):
+    """
+    Canonical display form of a memory: no list bullet, single spaces.
+    """
+    return re.sub(r"\s+", " ", re.sub(r"^\s*[-*\u2022]\s*", "", text or "")).strip()
+
+def memory_hash(text):
+    """
+    Dedupe key for a memory: case, trailing punctuation and bullets don't matter.
+    """
+    return hashlib.sha1(normalize_memory(text).lower().rstrip('.!').encode('utf-8')).hexdigest()
+
+def month_day_key(entry_date):
+    return entry_date.month * 100 + entry_date.day
+
+def entry_snippet(content):
+    """
+    The first SNIPPET_LENGTH characters of an entry with whitespace collapsed, as shown in the journal views.
+    """
+    text = ' '.join((content or '').split())
+    return text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 3].rstrip() + '...'
 
-    __table_args__ = (UniqueConstraint('date', 'user_id', name='_date_user_uc'),)
\ No newline at end of file
+@event.listens_for(JournalEntry, 'before_insert')
+@event.listens_for(JournalEntry, 'before_update')
+def _set_derived_columns(mapper, connection, entry):
+    if entry.date is not None:
+        entry.month_day = month_day_key(entry.date)
+    entry.snippet = entry_snippet(entry.content)
+    entry.has_ai_response = bool(entry.ai_response)
\ No newline at end of file
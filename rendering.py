@@ -0,0 +1,54 @@
+import hashlib
+from functools import lru_cache
+import mistune
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.attributes import flag_modified
+from models import db
+
+# Bump whenever the markdown configuration changes, then run `flask --app app rerender-entries`
+# so stored HTML is regenerated (rows with an old hash are also re-rendered lazily on view).
+RENDER_VERSION = '1'
+
+@lru_cache(maxsize=512)
+def render_markdown(text):
+    """
+    Renders markdown to HTML. Cached in-process for rows whose stored HTML is missing or stale.
+    """
+    return mistune.html(text or '')
+
+def render_hash(content, ai_response):
+    return hashlib.sha1(f"{RENDER_VERSION}\0{content or ''}\0{ai_response or ''}".encode('utf-8')).hexdigest()
+
+def render_entry(entry):
+    """
+    Stores freshly rendered HTML for an entry's content and AI response.
+    """
+    entry.content_html = render_markdown(entry.content)
+    entry.ai_response_html = render_markdown(entry.ai_response) if entry.ai_response else None
+    entry.render_hash = render_hash(entry.content, entry.ai_response)
+
+def ensure_rendered(entry):
+    """
+    Re-renders an entry whose stored HTML is missing or out of date. Returns True if it changed.
+    """
+    if entry.render_hash == render_hash(entry.content, entry.ai_response):
+        return False
+    render_entry(entry)
+    return True
+
+def ensure_entry_rendered(entry):
+    """
+    ensure_rendered(), committing the backfilled HTML of rows saved before it was stored (or
+    rendered by an older RENDER_VERSION). If the commit fails, e.g. the database is busy, the
+    in-process render cache covers us. Returns True if the entry was re-rendered.
+    Only the stored HTML changes, so updated_at (and the HTTP validators built on it) is kept.
+    """
+    if not ensure_rendered(entry):
+        return False
+    flag_modified(entry, 'updated_at')  # Written back as is, which skips its onupdate
+    try:
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
+        ensure_rendered(entry)
+    return True
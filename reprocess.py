@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import or_
+from models import db, User, JournalEntry, AnalysisJob
+from utils import get_ai_analysis, FALLBACK_ANALYSIS_RESPONSE
+from analysis_queue import apply_analysis, memory_context_for
+from llm import TokenBucket
+
+REPROCESS_TARGETS = ('missing', 'fallback', 'all')
+
+class ReprocessAborted(Exception):
+    pass
+
+def target_filter(targets):
+    """
+    SQL filter for entries whose AI response should be regenerated.
+    """
+    if 'all' in targets:
+        return True
+    conditions = []
+    if 'missing' in targets:
+        conditions.append(or_(JournalEntry.ai_response.is_(None), JournalEntry.ai_response == ''))
+    if 'fallback' in targets:
+        conditions.append(or_(JournalEntry.ai_response == FALLBACK_ANALYSIS_RESPONSE, JournalEntry.analysis_status == 'failed'))
+    return or_(*conditions)
+
+def find_targets(targets, user_id=None, since=None, until=None):
+    """
+    Returns {user_id: [(entry id, date), ...]} in date order. Entries with a queued or running
+    background analysis are left to the AnalysisQueue.
+    """
+    query = db.session.query(JournalEntry.user_id, JournalEntry.id, JournalEntry.date) \
+        .filter(target_filter(targets), JournalEntry.analysis_status != 'pending')
+    if user_id is not None:
+        query = query.filter(JournalEntry.user_id == user_id)
+    if since is not None:
+        query = query.filter(JournalEntry.date >= since)
+    if until is not None:
+        query = query.filter(JournalEntry.date <= until)
+    by_user = {}
+    for row in query.order_by(JournalEntry.user_id, JournalEntry.date):
+        by_user.setdefault(row.user_id, []).append((row.id, row.date))
+    return by_user
+
+class Checkpoint:
+    """
+    Progress of a reprocess run in a JSON file, rewritten atomically after every entry: the
+    date of the last entry handled per user and the ids that failed (retried on resume).
+    """
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.users = {}
+        self.failed = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Resumes from the file if it exists. Raises ValueError if it was written for other options.
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('params') != self.params:
+            raise ValueError(f"{self.path} was written by a run with different options: {data.get('params')}")
+        self.users = data.get('users', {})
+        self.failed = set(data.get('failed', []))
+        return True
+
+    def is_done(self, user_id, entry_id, entry_date):
+        last = self.users.get(str(user_id))
+        return last is not None and entry_date.isoformat() <= last and entry_id not in self.failed
+
+    def mark(self, user_id, entry_id, entry_date, ok):
+        with self._lock:
+            self.users[str(user_id)] = entry_date.isoformat()
+            if ok:
+                self.failed.discard(entry_id)
+            else:
+                self.failed.add(entry_id)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'params': self.params, 'users': self.users, 'failed': sorted(self.failed)}, f)
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class Reprocessor:
+    """
+    Regenerates AI responses for existing entries outside the web app, e.g. after a prompt
+    change or a model outage. Users are processed in parallel (up to `concurrency` at a time);
+    each user's entries run one at a time in date order, so memories learned from earlier
+    entries are in the context of later ones, as when they were first written. Model calls go
+    through the shared LLM client limits, plus an optional stricter `rate_per_minute` here.
+    After `max_consecutive_errors` failures in a row (an outage, most likely) the run stops;
+    run it again to resume from the checkpoint.
+    """
+    def __init__(self, app, checkpoint, concurrency=2, rate_per_minute=None, max_consecutive_errors=10,
+                 progress_every=25, echo=print):
+        self.app = app
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate_per_minute / 60.0, 1) if rate_per_minute else None
+        self.max_consecutive_errors = max_consecutive_errors
+        self.progress_every = progress_every
+        self.echo = echo
+        self.stats = {'users': 0, 'entries': 0, 'resumed': 0, 'processed': 0, 'failed': 0, 'changed': 0}
+        self.errors = []
+        self._consecutive_errors = 0
+        self._aborted = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, targets_by_user):
+        started = time.perf_counter()
+        self.stats['users'] = len(targets_by_user)
+        self.stats['entries'] = sum(len(entries) for entries in targets_by_user.values())
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='reprocess') as executor:
+            for future in [executor.submit(self._run_user, user_id, entries) for user_id, entries in targets_by_user.items()]:
+                future.result()
+        seconds = time.perf_counter() - started
+        self.stats.update(seconds=round(seconds, 1), aborted=self._aborted.is_set(),
+                          entries_per_min=round(self.stats['processed'] * 60 / seconds, 1) if seconds else 0.0)
+        return self.stats
+
+    def _count(self, key, error=None):
+        with self._lock:
+            self.stats[key] += 1
+            if key == 'failed':
+                self._consecutive_errors += 1
+                if len(self.errors) < 20:
+                    self.errors.append(error)
+                if self._consecutive_errors >= self.max_consecutive_errors:
+                    self._aborted.set()
+            elif key == 'processed':
+                self._consecutive_errors = 0
+            done = self.stats['processed'] + self.stats['failed'] + self.stats['changed']
+        if key != 'resumed' and self.progress_every and done % self.progress_every == 0:
+            self.echo(f"{done}/{self.stats['entries'] - self.stats['resumed']} entries, {self.stats['failed']} failed")
+
+    def _run_user(self, user_id, entries):
+        with self.app.app_context():
+            for entry_id, entry_date in entries:
+                if self._aborted.is_set():
+                    return
+                if self.checkpoint.is_done(user_id, entry_id, entry_date):
+                    self._count('resumed')
+                    continue
+                try:
+                    outcome = self._process(user_id, entry_id)
+                except Exception as e:
+                    db.session.rollback()
+                    self.checkpoint.mark(user_id, entry_id, entry_date, ok=False)
+                    self._count('failed', f"entry {entry_id} ({entry_date}): {e}")
+                    continue
+                self.checkpoint.mark(user_id, entry_id, entry_date, ok=True)
+                self._count(outcome)
+
+    def _process(self, user_id, entry_id):
+        user, entry = db.session.get(User, user_id), db.session.get(JournalEntry, entry_id)
+        if entry is None:
+            return 'changed'
+        content = entry.content
+        context = memory_context_for(self.app.config, user, content)
+        db.session.rollback()  # Don't hold a read transaction open across the model call
+        if self.bucket is not None and not self.bucket.acquire(timeout=3600):
+            raise ReprocessAborted("rate limit wait timed out")
+        analysis = get_ai_analysis(self.app.config['GEMINI_API_KEY'], content, context.user_memories, context.ai_memories,
+                                   context.forgotten_memories, strict=True, context_stats=context.stats)
+        entry, user = db.session.get(JournalEntry, entry_id), db.session.get(User, user_id)
+        if entry is None or entry.content != content or entry.analysis_status == 'pending':
+            # Edited (and queued for analysis) while we waited on the model
+            db.session.rollback()
+            return 'changed'
+        apply_analysis(entry, user, analysis)
+        job = AnalysisJob.query.filter_by(entry_id=entry_id).first()
+        if job is not None and job.status == 'failed':
+            job.status, job.last_error = 'done', None
+        db.session.commit()
+        return 'processed'
@@ -0,0 +1,25 @@
+import hashlib
+from cache import make_cache
+
+def normalize_query(query):
+    return ' '.join((query or '').lower().split())
+
+class SearchCache:
+    """
+    Caches search results (ordered entry ids) per (user id, corpus version, normalized query).
+    Writes that change entry contents bump User.corpus_version, so stale results are never
+    looked up again and simply age out of the LRU/TTL cache.
+    """
+    def __init__(self, config):
+        self.cache = make_cache(config, 'search', config.get('SEARCH_CACHE_SIZE', 2048), config.get('SEARCH_CACHE_TTL', 3600))
+
+    @staticmethod
+    def key(user_id, corpus_version, query, mode):
+        digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()[:16]
+        return f"{user_id}:{corpus_version}:{mode}:{digest}"
+
+    def get(self, user_id, corpus_version, query, mode):
+        return self.cache.get(self.key(user_id, corpus_version, query, mode))
+
+    def set(self, user_id, corpus_version, query, mode, entry_ids):
+        self.cache.set(self.key(user_id, corpus_version, query, mode), list(entry_ids))
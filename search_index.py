@@ -0,0 +1,167 @@
+from sqlalchemy import text, or_, bindparam
+from sqlalchemy.exc import OperationalError
+from models import db, JournalEntry
+from utils import tokenize
+
+FTS_TABLE = 'journal_entry_fts'
+
+_STOPWORDS = {
+    'a', 'about', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'did', 'do', 'for', 'from', 'had', 'has',
+    'have', 'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'that', 'the', 'there', 'this', 'to',
+    'was', 'were', 'what', 'when', 'where', 'which', 'who', 'why', 'with',
+}
+
+# Set by init_search_index(); False when the database has no FTS5 support (or isn't SQLite),
+# in which case keyword_search() falls back to plain LIKE matching.
+_fts_enabled = False
+
+def init_search_index():
+    """
+    Creates the FTS5 index over JournalEntry.content if needed and brings it in sync
+    with the entries table. Must be called inside an app context.
+    """
+    global _fts_enabled
+    if db.engine.dialect.name != 'sqlite':
+        return
+    try:
+        existing = db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"), {'name': FTS_TABLE}).scalar()
+        if existing and 'UNINDEXED' in existing:
+            # Older layout: user_id could only be filtered after matching every user's entries. Rebuilt below.
+            db.session.execute(text(f"DROP TABLE {FTS_TABLE}"))
+            print("Rebuilding the full-text index with an indexed user_id column")
+        # user_id is indexed so queries can restrict the MATCH itself to one user (see _user_match)
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(content, user_id, tokenize='porter unicode61')"
+        ))
+    except OperationalError as e:
+        db.session.rollback()
+        print(f"Full-text search unavailable, falling back to LIKE matching: {e}")
+        return
+    _fts_enabled = True
+    # Backfill rows written before the index existed and drop rows whose entry is gone.
+    db.session.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, content, user_id) SELECT id, content, user_id FROM journal_entry "
+        f"WHERE id NOT IN (SELECT rowid FROM {FTS_TABLE})"
+    ))
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT id FROM journal_entry)"))
+    db.session.commit()
+
+def index_entry(entry):
+    """
+    Adds or refreshes a single entry in the index. Runs in the caller's session,
+    so the index update commits (or rolls back) together with the entry itself.
+    """
+    if not _fts_enabled:
+        return
+    if entry.id is None:
+        db.session.flush()
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': entry.id})
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}(rowid, content, user_id) VALUES (:id, :content, :user_id)"),
+                       {'id': entry.id, 'content': entry.content, 'user_id': entry.user_id})
+
+def index_entries(entry_ids, batch_size=500):
+    """
+    Bulk version of index_entry() for rows written without the ORM. Runs in the caller's session.
+    """
+    if not _fts_enabled:
+        return
+    entry_ids = list(entry_ids)
+    for start in range(0, len(entry_ids), batch_size):
+        params = {'ids': entry_ids[start:start + batch_size]}
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)), params)
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}(rowid, content, user_id) SELECT id, content, user_id "
+                                f"FROM journal_entry WHERE id IN :ids").bindparams(bindparam('ids', expanding=True)), params)
+
+def remove_user_entries(user_id):
+    """
+    Drops every indexed entry belonging to a user (used when entries are cleared or the account is deleted).
+    """
+    if not _fts_enabled:
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match)"),
+                       {'match': _user_match(user_id)})
+
+def _user_match(user_id, terms_query=None):
+    """
+    An FTS5 query limited to one user's entries, so matching and ranking never touch other users' rows.
+    """
+    user_filter = f'user_id:"{int(user_id)}"'
+    return f"{user_filter} AND ({terms_query})" if terms_query else user_filter
+
+def query_terms(search_query):
+    """
+    Splits a search query into lowercase keyword terms, dropping common stopwords.
+    """
+    terms = [w for w in tokenize(search_query) if w not in _STOPWORDS]
+    return list(dict.fromkeys(terms))
+
+def keyword_search(user_id, search_query, limit):
+    """
+    Returns up to `limit` entry ids for the user, best keyword matches first.
+    """
+    terms = query_terms(search_query)
+    if not terms:
+        return []
+    if _fts_enabled:
+        terms_query = ' OR '.join('content:"' + t.replace('"', '""') + '"' for t in terms)
+        # The user_id column gets zero weight so only the content terms rank results
+        rows = db.session.execute(text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, 1.0, 0.0) LIMIT :limit"
+        ), {'match': _user_match(user_id, terms_query), 'limit': limit})
+        return [row[0] for row in rows]
+    rows = db.session.query(JournalEntry.id).filter(
+        JournalEntry.user_id == user_id,
+        or_(*[JournalEntry.content.ilike(f"%{t}%") for t in terms])
+    ).order_by(JournalEntry.date.desc()).limit(limit)
+    return [row[0] for row in rows]
+
+def sync_vector_index(vector_index, user_id, batch_size=500):
+    """
+    Embeds the user's entries written since the last sync (ids above the index's watermark) and
+    those marked stale by edits or imports. Cheap when the index is up to date: one id lookup.
+    """
+    watermark, pending = vector_index.pending(user_id)
+    new_ids = [row[0] for row in db.session.query(JournalEntry.id).filter(
+        JournalEntry.user_id == user_id, JournalEntry.id > watermark).order_by(JournalEntry.id)]
+    stale_ids = sorted(int(entry_id) for entry_id in pending)
+    if not new_ids and not stale_ids:
+        return
+    for start in range(0, max(len(new_ids), len(stale_ids)), batch_size):
+        batch = new_ids[start:start + batch_size]
+        stale = stale_ids[start:start + batch_size]
+        rows = db.session.query(JournalEntry.id, JournalEntry.content).filter(
+            JournalEntry.user_id == user_id, JournalEntry.id.in_(batch + stale)).all()
+        found = {row.id for row in rows}
+        vector_index.upsert(user_id, [(row.id, row.content) for row in rows],
+                            remove_ids=[entry_id for entry_id in stale if entry_id not in found],
+                            watermark=batch[-1] if batch else None,
+                            synced={str(entry_id): pending[str(entry_id)] for entry_id in stale})
+
+def vector_index_stale(vector_index, user_id):
+    """
+    True while some of the user's entries wait to be (re-)embedded by sync_vector_index.
+    """
+    watermark, pending = vector_index.pending(user_id)
+    return bool(pending) or db.session.query(JournalEntry.id).filter(
+        JournalEntry.user_id == user_id, JournalEntry.id > watermark).first() is not None
+
+def hybrid_search(vector_index, user_id, search_query, limit, min_score=0.0):
+    """
+    Shortlists up to `limit` entry ids by fusing keyword (FTS) and semantic (vector) rankings
+    with reciprocal rank fusion. Never embeds entries: pass vector_index=None for keyword-only
+    results while the index is stale (see vector_index_stale).
+    """
+    keyword_ids = keyword_search(user_id, search_query, limit)
+    semantic_ids = []
+    if vector_index is not None:
+        try:
+            semantic_ids = [entry_id for entry_id, _ in vector_index.search(user_id, search_query, limit, min_score)]
+        except Exception as e:
+            print(f"Error querying vector index: {e}")
+    scores = {}
+    for ranking in (keyword_ids, semantic_ids):
+        for rank, entry_id in enumerate(ranking):
+            scores[entry_id] = scores.get(entry_id, 0.0) + 1.0 / (60 + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
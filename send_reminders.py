@@ -1,52 +1,143 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from sqlalchemy import exists, insert, delete
+from sqlalchemy.exc import IntegrityError
 from app import app, db, mail  # Import the app, db, and mail instances from your main app
-from models import User, JournalEntry
+from models import User, JournalEntry, ReminderLog
+from metrics import REGISTRY, observe_mail
 from flask_mail import Message
 
-def send_daily_reminders():
+def users_due(hour, today):
+    """
+    Single anti-join query: users with a reminder at this hour and an email address, who have
+    neither written today's entry nor already been reminded today.
+    """
+    wrote_today = exists().where(JournalEntry.user_id == User.id, JournalEntry.date == today)
+    reminded_today = exists().where(ReminderLog.user_id == User.id, ReminderLog.sent_on == today)
+    return db.session.query(User.id, User.username, User.email) \
+        .filter(User.reminder_time == hour, User.email != None, ~wrote_today, ~reminded_today).all()
+
+def build_reminder(username, email):
+    msg = Message(
+        subject="Your Daily JournAI Reminder",
+        sender=("JournAI", app.config['MAIL_USERNAME']),
+        recipients=[email]
+    )
+    # The body of the email can be plain text or HTML
+    msg.body = f"Hi {username},\n\nJust a friendly reminder to take a moment for yourself and capture your thoughts for the day.\n\nWrite your entry here: https://journai.pythonanywhere.com/\n\nBest,\nThe JournAI Companion"
+    # msg.html = "<b>You can also use HTML for fancier emails!</b>"
+    return msg
+
+def _send_batch(batch):
+    """
+    Sends a batch of reminders over one reused SMTP connection. Returns (sent user ids, failures).
+    """
+    sent, failed = [], []
+    with app.app_context():
+        try:
+            with mail.connect() as conn:
+                for user in batch:
+                    started = time.perf_counter()
+                    try:
+                        conn.send(build_reminder(user.username, user.email))
+                        sent.append(user.id)
+                        observe_mail(time.perf_counter() - started, ok=True)
+                        print(f"Reminder sent to {user.username} at {user.email} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+                    except Exception as e:
+                        failed.append((user, e))
+                        observe_mail(time.perf_counter() - started, ok=False)
+                        print(f"!!! FAILED to send email to {user.username}: {e}")
+        except Exception as e:
+            # Couldn't connect (or the connection dropped); everything not yet sent in this batch failed.
+            done = set(sent) | {user.id for user, _ in failed}
+            failed.extend((user, e) for user in batch if user.id not in done)
+            print(f"!!! SMTP connection failed: {e}")
+    return sent, failed
+
+def _claim(users, hour, today, now, attempts=3):
+    """
+    Records the reminders as sent before sending. If another run claimed some of the same users
+    first, the unique constraint rejects the insert and we retry with a fresh list of due users.
+    """
+    for _ in range(attempts):
+        try:
+            db.session.execute(insert(ReminderLog), [{'user_id': u.id, 'sent_on': today, 'sent_at': now} for u in users])
+            db.session.commit()
+            return users
+        except IntegrityError:
+            db.session.rollback()
+            users = users_due(hour, today)
+            if not users:
+                return []
+    raise RuntimeError("Could not claim reminders; is another reminder run in progress?")
+
+def send_daily_reminders(hour=None, dry_run=False, smtp=None):
     """
     This script is run by a scheduler (like PythonAnywhere's tasks).
     It checks the current time and sends reminders to users.
+
+    Reminders are claimed in ReminderLog before sending (and released again if sending fails),
+    so overlapping or repeated runs in the same day never double-send. Messages go out in
+    batches, each over a single SMTP connection, with MAIL_SEND_WORKERS batches in parallel.
+    With dry_run=True nothing is recorded, and mail is only delivered if `smtp` ("host:port")
+    points at a local stand-in such as `python -m aiosmtpd -n -l localhost:1025`.
     """
     # Use the app context to access the database and configuration
     with app.app_context():
+        started = time.perf_counter()
         # Get the current hour in UTC (servers run on UTC time)
-        current_utc_hour = datetime.utcnow().hour
-        
-        print(f"[{datetime.utcnow()}] Running reminder job for UTC hour: {current_utc_hour}")
+        now = datetime.utcnow()
+        current_utc_hour = now.hour if hour is None else hour
+        today = now.date()
+        stats = {'hour': current_utc_hour, 'due': 0, 'sent': 0, 'failed': 0, 'dry_run': dry_run}
 
-        # Find users who have set a reminder for the current hour and have an email
-        users_to_remind = User.query.filter_by(reminder_time=current_utc_hour).filter(User.email != None).all()
-        
+        print(f"[{now}] Running reminder job for UTC hour: {current_utc_hour}{' (dry run)' if dry_run else ''}")
+
+        state = app.extensions['mail']
+        if smtp:
+            state.server, port = smtp.rsplit(':', 1)
+            state.port, state.use_ssl, state.use_tls, state.username, state.password = int(port), False, False, None, None
+        state.suppress = (dry_run and not smtp) or app.config.get('MAIL_SUPPRESS_SEND', app.testing)
+
+        users_to_remind = users_due(current_utc_hour, today)
+        if users_to_remind and not dry_run:
+            users_to_remind = _claim(users_to_remind, current_utc_hour, today, now)
+        stats['due'] = len(users_to_remind)
         if not users_to_remind:
             print("No users to remind this hour.")
-            return
+            return stats
 
         print(f"Found {len(users_to_remind)} user(s) to remind.")
 
-        for user in users_to_remind:
-            # Check if the user has already written an entry today
-            today = datetime.utcnow().date()
-            entry_today = JournalEntry.query.filter_by(user_id=user.id, date=today).first()
-
-            if not entry_today:
-                try:
-                    msg = Message(
-                        subject="Your Daily JournAI Reminder",
-                        sender=("JournAI", app.config['MAIL_USERNAME']),
-                        recipients=[user.email]
-                    )
-                    # The body of the email can be plain text or HTML
-                    msg.body = f"Hi {user.username},\n\nJust a friendly reminder to take a moment for yourself and capture your thoughts for the day.\n\nWrite your entry here: https://journai.pythonanywhere.com/\n\nBest,\nThe JournAI Companion"
-                    # msg.html = "<b>You can also use HTML for fancier emails!</b>"
-                    
-                    mail.send(msg)
-                    print(f"Reminder sent successfully to {user.username} at {user.email}")
-
-                except Exception as e:
-                    print(f"!!! FAILED to send email to {user.username}: {e}")
-            else:
-                print(f"User {user.username} has already written an entry today. No reminder sent.")
+        batch_size = app.config.get('MAIL_BATCH_SIZE', 50)
+        batches = [users_to_remind[i:i + batch_size] for i in range(0, len(users_to_remind), batch_size)]
+        failed = []
+        with ThreadPoolExecutor(max_workers=app.config.get('MAIL_SEND_WORKERS', 4)) as pool:
+            for sent_ids, batch_failures in pool.map(_send_batch, batches):
+                stats['sent'] += len(sent_ids)
+                failed.extend(batch_failures)
+        stats['failed'] = len(failed)
+
+        if failed and not dry_run:
+            # Release claims for failed sends so the next run can retry them.
+            db.session.execute(delete(ReminderLog).where(ReminderLog.sent_on == today,
+                                                         ReminderLog.user_id.in_([user.id for user, _ in failed])))
+            db.session.commit()
+
+        stats['elapsed_s'] = round(time.perf_counter() - started, 3)
+        print(f"Reminder run finished: {stats}")
+        return stats
 
 if __name__ == '__main__':
-    send_daily_reminders()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Send daily JournAI reminder emails.")
+    parser.add_argument('--hour', type=int, help="UTC hour to process (defaults to the current hour)")
+    parser.add_argument('--dry-run', action='store_true', help="Don't record sends; don't deliver mail unless --smtp is given")
+    parser.add_argument('--smtp', metavar='HOST:PORT', help="Deliver to this SMTP server instead (plain, no auth), e.g. localhost:1025")
+    parser.add_argument('--metrics-file', help="Write this run's metrics here in Prometheus text format (e.g. for node_exporter's textfile collector)")
+    args = parser.parse_args()
+    send_daily_reminders(hour=args.hour, dry_run=args.dry_run, smtp=args.smtp)
+    if args.metrics_file:
+        with open(args.metrics_file, 'w') as f:
+            f.write(REGISTRY.render())
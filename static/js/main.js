@@ -81,6 +81,115 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
     }
+
+    // --- PENDING AI REFLECTION (view entry page) ---
+    const pendingResponse = document.getElementById('ai-response-pending');
+    if (pendingResponse) {
+        const contentEl = pendingResponse.querySelector('.ai-content');
+        const pollStatus = async () => {
+            try {
+                const response = await fetch(pendingResponse.dataset.statusUrl);
+                const data = await response.json();
+                if (data.status !== 'pending') {
+                    contentEl.innerHTML = data.ai_response_html || '';
+                    return;
+                }
+            } catch (e) { /* Network hiccup; try again on the next tick */ }
+            setTimeout(pollStatus, 2000);
+        };
+        const streamUrl = pendingResponse.dataset.streamUrl;
+        if (streamUrl && window.EventSource) {
+            // Show the reflection as it is generated, then swap in the rendered markdown.
+            const source = new EventSource(streamUrl);
+            let streamedText = '';
+            source.addEventListener('token', e => {
+                if (!streamedText) {
+                    contentEl.innerHTML = '<p class="ai-streaming"></p>';
+                }
+                streamedText += JSON.parse(e.data).text;
+                contentEl.querySelector('.ai-streaming').textContent = streamedText;
+            });
+            source.addEventListener('done', e => {
+                source.close();
+                contentEl.innerHTML = JSON.parse(e.data).ai_response_html || '';
+            });
+            source.addEventListener('wait', () => { source.close(); setTimeout(pollStatus, 1000); });
+            source.onerror = () => { source.close(); setTimeout(pollStatus, 1000); };
+        } else {
+            setTimeout(pollStatus, 1000);
+        }
+    }
+
+    // --- CALENDAR PAGE (month / year heatmap) ---
+    const calendarContainer = document.getElementById('calendar-container');
+    if (calendarContainer) {
+        const grid = document.getElementById('calendar-grid');
+        const title = document.getElementById('calendar-title');
+        const MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'];
+        const WEEKDAYS = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'];
+        const now = new Date();
+        const todayStr = new Date(Date.UTC(now.getFullYear(), now.getMonth(), now.getDate())).toISOString().slice(0, 10);
+        let state = { view: calendarContainer.dataset.view, date: calendarContainer.dataset.date, range: null };
+
+        const parseDate = str => new Date(str + 'T00:00:00Z');
+        const addDays = (d, n) => new Date(d.getTime() + n * 86400000);
+        const fetchRange = async (view, date) => {
+            // 'no-cache' revalidates with the stored ETag, so unchanged ranges come back as an empty 304
+            const response = await fetch(`${calendarContainer.dataset.rangeUrl}?view=${view}&date=${date}`, { cache: 'no-cache' });
+            return response.json();
+        };
+        const dayCell = (d, entry, label) => {
+            const dateStr = d.toISOString().slice(0, 10);
+            const cell = document.createElement(dateStr > todayStr ? 'span' : 'a');
+            cell.className = 'calendar-cell';
+            if (entry) {
+                cell.classList.add('has-entry');
+                if (entry.has_ai) cell.classList.add('has-ai');
+                cell.href = `/entry/view/${dateStr}`;
+            } else if (dateStr <= todayStr) {
+                cell.href = `/entry/edit/${dateStr}`;
+            }
+            if (dateStr === todayStr) cell.classList.add('today');
+            cell.title = entry && entry.snippet ? `${dateStr}: ${entry.snippet}` : dateStr;
+            if (label) cell.textContent = label;
+            return cell;
+        };
+        const render = range => {
+            const entries = new Map(range.entries.map(entry => [entry.date, entry]));
+            const start = parseDate(range.start), end = parseDate(range.end);
+            grid.innerHTML = '';
+            grid.className = `calendar-grid calendar-${range.view}`;
+            title.textContent = range.view === 'year' ? `${start.getUTCFullYear()}` : `${MONTHS[start.getUTCMonth()]} ${start.getUTCFullYear()}`;
+            if (range.view === 'month') {
+                WEEKDAYS.forEach(name => {
+                    const header = document.createElement('span');
+                    header.className = 'calendar-weekday';
+                    header.textContent = name;
+                    grid.appendChild(header);
+                });
+            }
+            // Pad the first week so every column (month) or row (year) is one weekday
+            for (let i = 0; i < start.getUTCDay(); i++) {
+                grid.appendChild(document.createElement('span'));
+            }
+            for (let d = start; d <= end; d = addDays(d, 1)) {
+                grid.appendChild(dayCell(d, entries.get(d.toISOString().slice(0, 10)), range.view === 'month' ? `${d.getUTCDate()}` : ''));
+            }
+        };
+        const show = async (view, date) => {
+            const range = await fetchRange(view, date);
+            state = { view, date, range };
+            history.replaceState(null, '', `?view=${view}&date=${date}`);
+            render(range);
+        };
+
+        document.getElementById('calendar-prev').addEventListener('click', () => show(state.view, state.range.prev));
+        document.getElementById('calendar-next').addEventListener('click', () => show(state.view, state.range.next));
+        document.querySelectorAll('[data-calendar-view]').forEach(button => {
+            button.addEventListener('click', () => show(button.dataset.calendarView, state.range ? state.range.start : state.date));
+        });
+        show(state.view, state.date);
+    }
 });
 
 const canvas = document.getElementById('particle-canvas');
@@ -0,0 +1,74 @@
+import json
+import time
+
+# Streaming prompts ask for the reflection as plain markdown, then this line, then a JSON array of
+# new memory sentences. That way the reflection can be shown as it arrives and only the short
+# memory list has to be parsed at the end.
+MEMORY_DELIMITER = "<<<NEW_MEMORIES>>>"
+
+class AnalysisStream:
+    """
+    Wraps a streaming model response. Iterating yields the reflection text as it arrives;
+    once exhausted, `analysis` holds the same dict shape get_ai_analysis returns.
+    """
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.analysis = None
+        self.first_token_at = None
+        self.started_at = time.monotonic()
+
+    def __iter__(self):
+        response, tail, pending = [], [], ''
+        in_memories = False
+        for chunk in self._chunks:
+            text = getattr(chunk, 'text', chunk) or ''
+            if in_memories:
+                tail.append(text)
+                continue
+            pending += text
+            if MEMORY_DELIMITER in pending:
+                text, rest = pending.split(MEMORY_DELIMITER, 1)
+                tail.append(rest)
+                in_memories, pending = True, ''
+            else:
+                # Hold back anything that could be the start of the delimiter.
+                keep = _partial_suffix(pending, MEMORY_DELIMITER)
+                text, pending = pending[:len(pending) - keep], pending[len(pending) - keep:]
+            if text:
+                if self.first_token_at is None:
+                    self.first_token_at = time.monotonic()
+                response.append(text)
+                yield text
+        if pending:
+            response.append(pending)
+            yield pending
+        self.analysis = {'response': ''.join(response).strip(), 'new_memory_sentences': _parse_memories(''.join(tail))}
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+def _partial_suffix(text, delimiter):
+    for size in range(min(len(text), len(delimiter) - 1), 0, -1):
+        if delimiter.startswith(text[-size:]):
+            return size
+    return 0
+
+def _parse_memories(text):
+    cleaned = text.strip().replace("```json", "").replace("```", "").strip()
+    if not cleaned:
+        return []
+    try:
+        memories = json.loads(cleaned)
+    except json.JSONDecodeError as e:
+        print(f"Error parsing streamed memories: {e}")
+        return []
+    if isinstance(memories, dict):
+        memories = memories.get('new_memory_sentences', [])
+    return [m for m in memories if isinstance(m, str) and m.strip()] if isinstance(memories, list) else []
+
+def sse_event(event, data):
+    """
+    Formats one Server-Sent Events message with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
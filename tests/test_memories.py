@@ -0,0 +1,46 @@
+import os
+import sys
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, User, Memory
+
+@pytest.fixture
+def user():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='alice', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        yield user
+        db.session.remove()
+
+def test_clear_keeps_forgotten_memories(user):
+    user.add_ai_memories(['Has a dog.', 'Likes tea.', 'Lives in Leeds.'])
+    db.session.commit()
+    user.forget_memory('Has a dog.')
+    db.session.commit()
+
+    user.clear_ai_memories()
+    db.session.commit()
+
+    assert user.ai_memories == ''
+    assert user.forgotten_memories == ['Has a dog.']
+    assert user.add_ai_memories(['Has a dog', 'Likes tea']) == ['Likes tea']
+
+def test_clear_drops_memories_merged_into_active_ones(user):
+    user.add_ai_memories(['Likes tea.', 'Likes green tea.'])
+    db.session.commit()
+    keeper, merged = Memory.query.order_by(Memory.id).all()
+    merged.merged_into_id = keeper.id
+    db.session.commit()
+
+    user.clear_ai_memories()
+    db.session.commit()
+
+    assert Memory.query.count() == 0
@@ -1,13 +1,36 @@
-import google.generativeai as genai
 import json
+import re
+import numpy as np
+from llm import get_client
+from streaming import AnalysisStream, MEMORY_DELIMITER
+
+DEFAULT_GREETING = "Welcome back! Ready to write?"
+FALLBACK_ANALYSIS_RESPONSE = "I had a little trouble reflecting on your entry, but I've saved it for you."
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# --- Text helpers ---
+
+def tokenize(text):
+    """
+    The lowercased words of a text, as used for search terms, embeddings and memory comparisons.
+    """
+    return _WORD_RE.findall((text or '').lower())
+
+def normalize_rows(vectors):
+    """
+    Scales each row to unit length (zero rows are left as they are), so dot products are cosine similarities.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+# --- Model calls ---
 
 def get_ai_greeting(api_key, user_memories):
     """
     Generates a smart, personalized greeting.
     """
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-
     prompt = f"""
     Based on the user memories, write a single, short, warm welcoming sentence for a journal dashboard.
     - If you know the user's name, you must use it in the greeting.
@@ -22,22 +45,16 @@ def get_ai_greeting(api_key, user_memories):
     Your Greeting:
     """
     try:
-        response = model.generate_content(prompt)
+        text = get_client(api_key).generate(prompt, purpose='greeting')
         # Clean up potential markdown or quotes
-        return response.text.strip().replace("*", "").replace("\"", "")
+        return text.strip().replace("*", "").replace("\"", "")
     except Exception:
-        return "Welcome back! Ready to write?"
-
-def get_ai_analysis(api_key, entry_content, user_memories, ai_memories, forgotten_memories):
-    """
-    Analyzes a journal entry to provide a response and extract new memories.
-    """
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+        return DEFAULT_GREETING
 
+def _analysis_prompt(entry_content, user_memories, ai_memories, forgotten_memories, output_instructions):
     forgotten_memories_str = "\n- ".join(forgotten_memories)
 
-    prompt = f"""
+    return f"""
     You are an AI journaling companion. Your task is to analyze a new journal entry based on the user's provided memories.
 
     Primary Goal: Persona Adaptation
@@ -59,28 +76,51 @@ def get_ai_analysis(api_key, entry_content, user_memories, ai_memories, forgotte
     --- PERMANENTLY FORGOTTEN MEMORIES (Do NOT re-learn these facts) ---
     - {forgotten_memories_str}
     --- TODAY'S JOURNAL ENTRY ---
-    {entry_content}
+    {entry_content}""" + output_instructions
+
+def get_ai_analysis(api_key, entry_content, user_memories, ai_memories, forgotten_memories, strict=False, context_stats=None):
+    """
+    Analyzes a journal entry to provide a response and extract new memories.
+    With strict=True, errors are raised instead of returning the fallback response (used by retrying callers).
+    `context_stats` (from memory_context.build_memory_context) is attached to the call's metrics.
+    """
+    prompt = _analysis_prompt(entry_content, user_memories, ai_memories, forgotten_memories, """
     --- REQUIRED OUTPUT (JSON format only) ---
     Return a single JSON object with two keys: "response" (a string) and "new_memory_sentences" (a JSON array of strings).
-    """
+    """)
     try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "")
+        text = get_client(api_key).generate(prompt, purpose='analysis', context=context_stats)
+        cleaned_text = text.strip().replace("```json", "").replace("```", "")
         analysis = json.loads(cleaned_text)
         return analysis
     except (json.JSONDecodeError, Exception) as e:
+        if strict:
+            raise
         print(f"Error processing AI analysis: {e}")
         return {
-            "response": "I had a little trouble reflecting on your entry, but I've saved it for you.",
+            "response": FALLBACK_ANALYSIS_RESPONSE,
             "new_memory_sentences": []
         }
 
-def perform_ai_search(api_key, search_query, all_entries_text):
+def stream_ai_analysis(api_key, entry_content, user_memories, ai_memories, forgotten_memories, context_stats=None):
+    """
+    Streaming variant of get_ai_analysis. Returns an AnalysisStream that yields the response text
+    as the model generates it; the parsed analysis is available on `.analysis` once it is exhausted.
+    Errors from the model are raised to the caller.
+    """
+    prompt = _analysis_prompt(entry_content, user_memories, ai_memories, forgotten_memories, f"""
+    --- REQUIRED OUTPUT ---
+    First write your response as plain markdown (no JSON, no code fences).
+    Then, on its own line, write exactly {MEMORY_DELIMITER}
+    Then write the new memory sentences as a JSON array of strings (an empty array if there are none).
+    """)
+    return AnalysisStream(get_client(api_key).stream(prompt, purpose='analysis_stream', context=context_stats))
+
+def perform_ai_search(api_key, search_query, all_entries_text, strict=False):
     """
     Uses AI to find dates of entries relevant to a natural language search query.
+    With strict=True, errors are raised instead of returning no results (so callers can avoid caching them).
     """
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
     prompt = f"""
     You are a search assistant for a personal journal. Read the following collection of journal entries and the user's search query.
     Your task is to identify which entries are most relevant to the query.
@@ -100,10 +140,12 @@ def perform_ai_search(api_key, search_query, all_entries_text):
     5. If no entries are relevant, return an empty array.
     """
     try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "")
+        text = get_client(api_key).generate(prompt, purpose='search')
+        cleaned_text = text.strip().replace("```json", "").replace("```", "")
         result = json.loads(cleaned_text)
         return result.get("relevant_dates", [])
     except (json.JSONDecodeError, Exception) as e:
+        if strict:
+            raise
         print(f"Error processing AI search: {e}")
         return []
\ No newline at end of file
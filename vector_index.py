@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from llm import get_client
+from utils import tokenize, normalize_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+MIN_CHUNK_CHARS = 80
+MAX_CHUNK_CHARS = 1000
+
+def chunk_text(content):
+    """
+    Splits an entry into paragraph-level chunks. Very short paragraphs are merged into
+    the next one and very long ones are cut on sentence boundaries.
+    """
+    chunks, pending = [], ''
+    for paragraph in _PARAGRAPH_RE.split(content or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        paragraph = f"{pending}\n\n{paragraph}" if pending else paragraph
+        if len(paragraph) < MIN_CHUNK_CHARS:
+            pending = paragraph
+            continue
+        pending = ''
+        while len(paragraph) > MAX_CHUNK_CHARS:
+            cut = paragraph.rfind('. ', 0, MAX_CHUNK_CHARS) + 1 or MAX_CHUNK_CHARS
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            chunks.append(paragraph)
+    if pending:
+        chunks.append(pending)
+    return chunks
+
+# --- Embedders ---
+
+class HashingEmbedder:
+    """
+    Deterministic, offline embedder: signed feature hashing of words and word pairs.
+    Only captures lexical overlap, but needs no network and gives stable vectors across runs.
+    """
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts, is_query=False):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                vectors[row, digest % self.dim] += 1.0 if (digest >> 63) else -1.0
+        return vectors
+
+class GeminiEmbedder:
+    """
+    Embeds text with the Gemini embedding API.
+    """
+    def __init__(self, api_key, model='models/text-embedding-004'):
+        self.api_key = api_key
+        self.model = model
+        self.name = f"gemini-{model}"
+
+    def embed(self, texts, is_query=False):
+        embeddings = get_client(self.api_key).embed(texts, self.model, 'retrieval_query' if is_query else 'retrieval_document')
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+def get_embedder(config):
+    """
+    Builds the embedder selected by EMBEDDING_BACKEND ('local' or 'gemini').
+    """
+    if config.get('EMBEDDING_BACKEND') == 'gemini' and config.get('GEMINI_API_KEY'):
+        return GeminiEmbedder(config['GEMINI_API_KEY'])
+    return HashingEmbedder(config.get('EMBEDDING_DIM', 256))
+
+
+# --- Index ---
+
+# Appended segments are merged once there are more than this many
+MAX_SEGMENTS = 8
+# A full compaction (dropping dead rows from the base segment) runs once this many entries are tombstoned
+# or a tenth of the indexed rows, whichever is larger
+MIN_COMPACT_TOMBSTONES = 256
+
+class VectorIndex:
+    """
+    Per-user embedding index stored under `root/<user_id>/` as immutable, append-only segments:
+      - seg-<name>-vectors.npy: float32 matrix of L2-normalised chunk embeddings (memory-mapped for search)
+      - seg-<name>-ids.npy: int64 entry id for each row
+      - meta.json: embedder name, the segments (each with a sequence number), tombstones, the
+        highest entry id synced so far (`watermark`) and entry ids waiting to be re-embedded.
+    Re-embedding an entry appends a small segment and tombstones the entry in older segments
+    ({entry id: sequence}: rows in segments below that sequence are dead), so a save costs the
+    size of one entry, not of the whole index. Small segments are merged, and dead rows dropped,
+    now and then. Segment names are unique and meta.json is replaced last under a file lock, so
+    several app processes can write the same user's index and readers always see complete segments.
+    """
+    def __init__(self, root, embedder):
+        self.root = root
+        self.embedder = embedder
+        self._lock = threading.Lock()
+        self._mapped = {}  # (user_id, segment name) -> (vectors, ids)
+
+    def _user_dir(self, user_id):
+        return os.path.join(self.root, str(int(user_id)))
+
+    @contextmanager
+    def _locked(self, user_id):
+        """
+        Serializes writers of one user's index across threads and processes.
+        """
+        user_dir = self._user_dir(user_id)
+        with self._lock:
+            os.makedirs(user_dir, exist_ok=True)
+            with open(os.path.join(user_dir, '.lock'), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield user_dir
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_meta(self, user_id):
+        try:
+            with open(os.path.join(self._user_dir(user_id), 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if not meta or meta.get('embedder') != self.embedder.name or 'segments' not in meta:
+            # New user, another embedder or the older single-matrix layout: start over (sync re-embeds everything)
+            return {'embedder': self.embedder.name, 'seq': 1, 'segments': [], 'tombstones': {}, 'watermark': 0, 'pending': {}}
+        return meta
+
+    def _segment(self, user_id, name):
+        key = (user_id, name)
+        if key not in self._mapped:
+            user_dir = self._user_dir(user_id)
+            self._mapped[key] = (np.load(os.path.join(user_dir, f'seg-{name}-vectors.npy'), mmap_mode='r'),
+                                 np.load(os.path.join(user_dir, f'seg-{name}-ids.npy'), mmap_mode='r'))
+        return self._mapped[key]
+
+    def _live_segments(self, user_id, meta):
+        """
+        Yields (vectors, ids, live row mask) per segment.
+        """
+        tombstones = meta['tombstones']
+        for segment in meta['segments']:
+            vectors, ids = self._segment(user_id, segment['name'])
+            dead = [int(entry_id) for entry_id, seq in tombstones.items() if seq > segment['seq']]
+            yield vectors, ids, ~np.isin(ids, dead) if dead else np.ones(len(ids), dtype=bool)
+
+    def _write_segment(self, user_dir, seq, vectors, ids):
+        name = f"{seq}-{uuid.uuid4().hex[:8]}"
+        np.save(os.path.join(user_dir, f'seg-{name}-vectors.npy'), vectors.astype(np.float32, copy=False))
+        np.save(os.path.join(user_dir, f'seg-{name}-ids.npy'), ids.astype(np.int64, copy=False))
+        return {'name': name, 'seq': seq, 'rows': len(ids)}
+
+    def _save_meta(self, user_id, user_dir, meta, dropped=()):
+        tmp_path = os.path.join(user_dir, f'meta.json.{uuid.uuid4().hex[:8]}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(user_dir, 'meta.json'))
+        for segment in dropped:
+            self._mapped.pop((user_id, segment['name']), None)
+            for suffix in ('vectors', 'ids'):
+                try:
+                    os.remove(os.path.join(user_dir, f"seg-{segment['name']}-{suffix}.npy"))
+                except OSError:
+                    pass
+
+    def _merge(self, user_id, user_dir, meta, segments):
+        """
+        Rewrites `segments` as one segment without their dead rows. Returns the new segment, or None if nothing is left.
+        """
+        live = {segment['name'] for segment in segments}
+        parts = [(vectors[mask], ids[mask]) for segment, (vectors, ids, mask)
+                 in zip(meta['segments'], self._live_segments(user_id, meta)) if segment['name'] in live]
+        parts = [(vectors, ids) for vectors, ids in parts if len(ids)]
+        if not parts:
+            return None
+        return self._write_segment(user_dir, max(segment['seq'] for segment in segments),
+                                   np.vstack([vectors for vectors, _ in parts]), np.concatenate([ids for _, ids in parts]))
+
+    def _compact(self, user_id, user_dir, meta):
+        """
+        Merges small segments into one, and everything (dropping all tombstones) once tombstones pile up.
+        Returns the segments that were replaced.
+        """
+        segments = meta['segments']
+        total_rows = sum(segment['rows'] for segment in segments)
+        if len(meta['tombstones']) > max(MIN_COMPACT_TOMBSTONES, total_rows // 10):
+            merging = segments
+        elif len(segments) > MAX_SEGMENTS:
+            merging = segments[1:]  # Leave the big base segment alone
+        else:
+            return []
+        merged = self._merge(user_id, user_dir, meta, merging)
+        meta['segments'] = [segment for segment in segments if segment not in merging] + ([merged] if merged else [])
+        if merging is segments:
+            meta['tombstones'] = {}
+        else:
+            # Only tombstones that still kill rows in the base segment matter
+            base_seq = segments[0]['seq']
+            meta['tombstones'] = {entry_id: seq for entry_id, seq in meta['tombstones'].items() if seq > base_seq}
+        return merging
+
+    def _embed_entries(self, entries):
+        rows, row_ids = [], []
+        for entry_id, content in entries:
+            chunks = chunk_text(content)
+            rows.extend(chunks)
+            row_ids.extend([entry_id] * len(chunks))
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        return normalize_rows(self.embedder.embed(rows)), np.asarray(row_ids, dtype=np.int64)
+
+    def upsert(self, user_id, entries, remove_ids=(), watermark=None, synced=None):
+        """
+        Embeds the given (entry_id, content) pairs as a new segment, replacing their older vectors,
+        and drops `remove_ids`. A sync passes the highest entry id it covered (`watermark`) and the
+        pending marks it read before loading the contents (`synced`, see pending); entries marked
+        stale again since then stay pending.
+        """
+        entries = list(entries)
+        new_vectors, new_ids = self._embed_entries(entries)  # Outside the lock; this is the slow part
+        with self._locked(user_id) as user_dir:
+            meta = self._load_meta(user_id)
+            seq = meta['seq']
+            meta['seq'] = seq + 2
+            for entry_id, _ in entries:
+                meta['tombstones'][str(entry_id)] = seq
+            for entry_id in remove_ids:
+                meta['tombstones'][str(int(entry_id))] = seq + 1
+            if len(new_ids):
+                meta['segments'].append(self._write_segment(user_dir, seq, new_vectors, new_ids))
+            if watermark is not None:
+                meta['watermark'] = max(meta['watermark'], int(watermark))
+            for entry_id, mark in (synced or {}).items():
+                if meta['pending'].get(entry_id) == mark:
+                    del meta['pending'][entry_id]
+            dropped = self._compact(user_id, user_dir, meta)
+            self._save_meta(user_id, user_dir, meta, dropped)
+
+    def mark_stale(self, user_id, entry_ids):
+        """
+        Queues entries to be re-embedded by the next sync (search_index.sync_vector_index).
+        Their current vectors stay searchable until then. Cheap enough for the request path.
+        """
+        with self._locked(user_id) as user_dir:
+            meta = self._load_meta(user_id)
+            for entry_id in entry_ids:
+                meta['pending'][str(int(entry_id))] = meta['seq']
+            meta['seq'] += 1
+            self._save_meta(user_id, user_dir, meta)
+
+    def pending(self, user_id):
+        """
+        Returns (watermark, {entry id: mark} queued by mark_stale). Entries above the watermark were never synced.
+        """
+        meta = self._load_meta(user_id)
+        return meta['watermark'], meta['pending']
+
+    def remove_user(self, user_id):
+        with self._locked(user_id) as user_dir:
+            for key in [key for key in self._mapped if key[0] == user_id]:
+                self._mapped.pop(key)
+            for name in os.listdir(user_dir):
+                if name != '.lock':
+                    os.remove(os.path.join(user_dir, name))
+        shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+
+    def search(self, user_id, query, k, min_score=0.0):
+        """
+        Returns up to k (entry_id, score) pairs ranked by the cosine similarity of each entry's best chunk.
+        """
+        if not (query or '').strip():
+            return []
+        meta = self._load_meta(user_id)
+        if not meta['segments']:
+            return []
+        query_vector = normalize_rows(self.embedder.embed([query], is_query=True))[0]
+        try:
+            segments = list(self._live_segments(user_id, meta))
+        except OSError:
+            # Another process compacted the segments away after we read meta.json
+            segments = list(self._live_segments(user_id, self._load_meta(user_id)))
+        current = {segment['name'] for segment in meta['segments']}
+        for key in [key for key in self._mapped if key[0] == user_id and key[1] not in current]:
+            self._mapped.pop(key, None)  # Compacted away, possibly by another process
+        all_scores, all_ids = [], []
+        for vectors, ids, mask in segments:
+            if len(ids) and vectors.shape[1] == len(query_vector):
+                all_scores.append(np.where(mask, vectors @ query_vector, -np.inf))
+                all_ids.append(ids)
+        if not all_scores:
+            return []
+        scores, ids = np.concatenate(all_scores), np.concatenate(all_ids)
+        # Chunks outnumber entries, so over-fetch before collapsing to one hit per entry.
+        top = min(len(scores), k * 8)
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        results = {}
+        for row in candidates[np.argsort(-scores[candidates])]:
+            if scores[row] <= min_score:
+                break
+            results.setdefault(int(ids[row]), float(scores[row]))
+            if len(results) >= k:
+                break
+        return list(results.items())